@@ -0,0 +1,156 @@
+import re
+import copy
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from vector_search import normalize_rows
+
+
+# Words that flip the meaning of otherwise near-identical questions
+POLARITY_TOKENS = frozenset({
+    "not", "no", "never", "without", "don't", "doesn't", "can't", "cannot", "won't", "isn't",
+    "on", "off", "enable", "disable", "activate", "deactivate",
+})
+
+
+def query_signature(text):
+    """
+    Tokens two queries must share for one to reuse the other's answer
+
+    Embeddings barely separate "page 12" from "page 13" or "turn on" from
+    "turn off", so numbers and polarity words are compared exactly.
+    """
+    tokens = re.findall(r"[a-z']+|\d+", text.lower())
+    return (tuple(t for t in tokens if t.isdigit()), frozenset(t for t in tokens if t in POLARITY_TOKENS))
+
+
+class SemanticAnswerCache:
+    """
+    Answers of past queries, looked up by embedding similarity
+
+    A query whose cosine similarity to a cached query reaches the threshold,
+    and whose numbers and polarity words match it (see query_signature),
+    gets that query's answer back. Entries expire after ttl_seconds, the
+    least recently used ones are evicted beyond max_size, and everything is
+    dropped when version_fn (e.g. the content_version of the manual) changes.
+    """
+
+    def __init__(self, threshold=0.92, max_size=256, ttl_seconds=3600, version_fn=None):
+        """
+        Args:
+            threshold: Minimum cosine similarity for a hit
+            max_size: Maximum number of cached answers
+            ttl_seconds: Age after which an answer is no longer served
+            version_fn: Function returning the current content version; the
+                cache is cleared whenever its value changes
+        """
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.version_fn = version_fn
+        self.version = version_fn() if version_fn else None
+
+        # id -> (normalized query vector, answer, created_at, query signature)
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._matrix = None
+        self._matrix_ids = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_version(self):
+        if self.version_fn is None:
+            return
+        version = self.version_fn()
+        if version != self.version:
+            if self._entries:
+                print(f"Content changed ({self.version} -> {version}), clearing answer cache")
+            self._entries.clear()
+            self._matrix = None
+            self.version = version
+
+    def _expire(self, now):
+        expired = [key for key, (_, _, created, _) in self._entries.items() if now - created > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _query_matrix(self):
+        # Rebuilt only after the set of entries changed
+        if self._matrix is None:
+            self._matrix_ids = list(self._entries.keys())
+            self._matrix = (np.stack([self._entries[key][0] for key in self._matrix_ids])
+                            if self._matrix_ids else None)
+        return self._matrix
+
+    def lookup(self, query_vector, query_text=None):
+        """
+        Answer of the most similar cached query, if similar enough
+
+        Args:
+            query_vector: Embedding of the query
+            query_text: The query itself; when given, only cached queries
+                with the same query_signature can match
+
+        Returns:
+            Tuple (answer, similarity): a deep copy of the cached answer, or
+            (None, best similarity) on a miss
+        """
+        query = normalize_rows(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+        with self._lock:
+            self._check_version()
+            self._expire(time.time())
+            matrix = self._query_matrix()
+            if matrix is None:
+                self.misses += 1
+                return None, 0.0
+
+            scores = matrix @ query
+            if query_text is not None:
+                signature = query_signature(query_text)
+                same = np.array([self._entries[key][3] in (None, signature) for key in self._matrix_ids])
+                scores = np.where(same, scores, -np.inf)
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None, similarity
+
+            key = self._matrix_ids[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(self._entries[key][1]), similarity
+
+    def store(self, query_vector, answer, query_text=None):
+        """Cache an answer for a query, evicting the least recently used beyond max_size"""
+        query = normalize_rows(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+        with self._lock:
+            self._check_version()
+            signature = query_signature(query_text) if query_text is not None else None
+            self._entries[self._next_id] = (query, copy.deepcopy(answer), time.time(), signature)
+            self._next_id += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
+
+    def report(self):
+        s = self.stats()
+        return (f"Answer cache: {s['hits']} hits / {s['misses']} misses "
+                f"({s['hit_rate']:.0%}), {s['size']}/{s['max_size']} entries")
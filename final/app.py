@@ -1,21 +1,26 @@
 # Import libraries at the beginning
 import json
-import sys
 import os
-from chatbot_text import get_response_json
 import re
 import numpy as np
 import cv2
 import time
+from concurrent.futures import ThreadPoolExecutor
 from crop_img_bo_retrieve import DashboardImageProcessor, ImageChatSession, _rerank_chunks, retrieve_context
-from similarity_img import rank_similar_images
+from manual_registry import ManualRegistry
+from similarity_img import rank_by_embedding, search_images_by_text
+from frame_features import FramePatchFeatures
+from model_registry import registry
+from query_encoder import encode_query, query_cache
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 
 # Global variables for pre-loaded resources
 script_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(script_dir)
-content_dir = os.path.join(parent_dir, "extracted_content_manual")
+
+# Manual served when a request does not name one (extracted_content_<id>)
+default_manual_id = os.getenv("DEFAULT_MANUAL", "manual")
 
 # Pre-initialize all heavy resources
 print("Inicializando recursos...")
@@ -25,39 +30,42 @@ try:
     # Initialize processor
     processor = DashboardImageProcessor()
 
-    # Setup ChromaDB
-    text_col, model_text = processor.setup_chromadb(content_dir)
+    # Per-manual chunks, vector store, chatbot and image indexes, loaded on
+    # first request and evicted (least recently used) over the memory budget
+    manuals = ManualRegistry(parent_dir, memory_budget_mb=int(os.getenv("MANUAL_MEMORY_BUDGET_MB", "2048")))
+    print(f"Available manuals: {', '.join(manuals.manual_dirs())}")
 
-    # Load chunks for retrieval
-    chunks = processor.load_chunks(content_dir)
+    # The default manual is loaded up front
+    manuals.get(default_manual_id)
 
-    # Make content_dir available to imported functions
-    sys.modules['crop_img_bo_retrieve'].content_dir = content_dir
+    # Precomputed patch tokens of the viewer frames (python frame_features.py);
+    # crops are encoded instead unless the stored parity check passed
+    frame_features = FramePatchFeatures.load_for_serving()
 
     # Create chat session
     chat_session = ImageChatSession()
 
-    # Initialize chatbot
-    chatbot = get_response_json()
-
     print(f"Recursos cargados correctamente en {time.time() - start_time:.2f} segundos")
+    print(registry.report())
     resources_loaded = True
 
 except Exception as e:
     print(f"Error al cargar recursos: {str(e)}")
     resources_loaded = False
 
+# Runs CLIP figure search alongside the LLM call
+figure_search_executor = ThreadPoolExecutor(max_workers=4)
+
 # Initialize Flask app
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
-def get_image_paths(image_ids):
+def get_image_paths(image_ids, content_dir="extracted_content_manual"):
     """
     Given a list of image IDs, return the paths of the images
-    located in the extracted_content_manual/images directory.
+    located in the <content_dir>/images directory.
     If the image ID is a number, it will count the images and select the nth image.
     """
-    content_dir = "extracted_content_manual"  # Define the base directory
     image_dir = os.path.join(content_dir, "images")
     image_paths = []
 
@@ -69,16 +77,66 @@ def get_image_paths(image_ids):
         
     return result
 
-def main(query):
+def get_figure_numbers(image_paths, content_dir="extracted_content_manual"):
+    """
+    Inverse of get_image_paths: figure numbers of the given image file names
+    """
+    all_images = os.listdir(os.path.join(content_dir, "images"))
+    return [all_images.index(path) - 4 for path in image_paths if path in all_images]
+
+def get_figure_paths(figure_future, figure_numbers, limit=2, content_dir="extracted_content_manual"):
+    """
+    Image file names and figure numbers for a chat answer
+
+    Prefers the CLIP text-to-image search started with the request and falls
+    back to the LLM's figure_numbers when the search is unavailable. The
+    figure numbers returned always describe the returned images.
+
+    Returns:
+        (image file names, figure numbers)
+    """
+    try:
+        figures = figure_future.result() if figure_future is not None else []
+    except Exception as e:
+        print(f"Figure search error: {str(e)}")
+        figures = []
+
+    if figures:
+        image_paths = [filename for filename, _ in figures[:limit]]
+        return image_paths, get_figure_numbers(image_paths, content_dir)
+    figure_numbers = list(figure_numbers)[:limit]
+    return get_image_paths(figure_numbers, content_dir), figure_numbers
+
+def main(query, manual_id=None):
     """
     Function to handle text queries.
+    Routes the query to the given manual (default manual if None).
     Returns JSON response.
     """
     if not query.strip():
         return {"error": "No question provided", "answer": "", "page_numbers": [], "figure_numbers": []}
 
     try:
+        manual = manuals.get(manual_id or default_manual_id)
+        answer_cache = manual.answer_cache
+        chatbot = manual.chatbot
+
+        # Paraphrases of an already answered question are served from the cache.
+        # Page questions and follow-ups depend on more than the wording (and a
+        # hit would skip the chat history), so they always go to the chatbot.
+        query_vector = encode_query(query)
+        use_answer_cache = not (chatbot.referenced_pages(query) or chatbot.is_followup_question(query))
+        if use_answer_cache:
+            cached, similarity = answer_cache.lookup(query_vector, query_text=query)
+            if cached is not None:
+                print(f"Answer cache hit (similarity {similarity:.3f}). {answer_cache.report()}")
+                return cached
+
+        # CLIP figure search does not depend on the answer, so it runs in parallel
+        figure_future = figure_search_executor.submit(search_images_by_text, query, 2, manual.image_index)
+
         response_text = chatbot.get_response(query, top_k=3)
+        print(query_cache.report())
 
         try:
             response_clean = re.sub(r'```json', '', response_text)
@@ -86,30 +144,36 @@ def main(query):
 
             response = json.loads(response_clean)
 
-            if "figure_numbers" in response:
-                image_ids = response["figure_numbers"]
-                image_paths = get_image_paths(image_ids)
-                response["image_paths"] = image_paths[:2]
+            # figure_numbers is rewritten to match the images actually returned
+            response["image_paths"], response["figure_numbers"] = get_figure_paths(
+                figure_future, response.get("figure_numbers", []), content_dir=manual.content_dir)
+
+            # Only well-formed answers are cached
+            if use_answer_cache:
+                answer_cache.store(query_vector, response, query_text=query)
 
             return response
 
         except json.JSONDecodeError:
             # Return a fallback JSON if parsing fails
+            image_paths, figure_numbers = get_figure_paths(figure_future, [], content_dir=manual.content_dir)
             response = {
                 "answer": response_text,
                 "page_numbers": [],
-                "figure_numbers": []
+                "figure_numbers": figure_numbers,
+                "image_paths": image_paths
             }
 
         return response
     except Exception as e:
         return {"error": str(e), "answer": "", "page_numbers": [], "figure_numbers": []}
 
-def image(image_path, box_coordinates):
+def image(image_path, box_coordinates, manual_id=None):
     """
     Function to handle image input and output.
     Uses pre-loaded resources for instant response.
-    Accepts image_path and box_coordinates as parameters.
+    Accepts image_path and box_coordinates as parameters, and the manual
+    to answer from (default manual if None).
     """
 
     # Ensure the image path is relative to the ../cupra_frames/ directory
@@ -123,6 +187,7 @@ def image(image_path, box_coordinates):
 
     try:
         start_time = time.time()
+        manual = manuals.get(manual_id or default_manual_id)
 
         # Check if file exists before processing
         if not os.path.exists(full_image_path):
@@ -136,35 +201,55 @@ def image(image_path, box_coordinates):
         # Get image description - using pre-loaded processor
         description = processor.get_image_description(full_image_path, box)
 
+        # Embed the description once: used for retrieval and for reranking
+        query_vector = encode_query(description["description"])
+
         # Use retrieve_context with pre-loaded resources
         image_paths_list, image_contexts = retrieve_context(
             query=description["description"],
-            top_k=20,
-            collection=text_col,
-            chunks=chunks
+            top_k=10,
+            collection=manual.vector_store,
+            chunks=manual.chunks,
+            page_images=manual.page_images.get(),
+            query_vector=query_vector,
+            section_index=manual.section_index
         )
 
-        # Get cropped image - check if image exists first
-        image = cv2.imread(full_image_path)
-        if image is None:
-            raise FileNotFoundError(f"Could not load image from {full_image_path}")
-
-        cropped = processor.crop_image(image, box)
-
-        # Rank similar images
-        scores = rank_similar_images(cropped, top_k=3, image_paths_list=image_paths_list)
+        # Region embedding pooled from the frame's stored patch tokens
+        region_emb = None
+        if frame_features is not None:
+            region_emb = frame_features.region_embedding(image_path, box_coordinates)
+
+        if region_emb is not None and not manual.image_ranker.needs_query_image(image_paths_list):
+            # No prefilter needed (indexed or few candidates): CLIP scoring directly,
+            # no need to decode the frame
+            scores = rank_by_embedding(region_emb, top_k=3, image_paths_list=image_paths_list,
+                                       index=manual.image_index)
+        else:
+            # Get cropped image - check if image exists first
+            image = cv2.imread(full_image_path)
+            if image is None:
+                raise FileNotFoundError(f"Could not load image from {full_image_path}")
+
+            cropped = processor.crop_image(image, box)
+
+            # Rank similar images: thumbnail prefilter, then CLIP (cv2 crop, BGR order)
+            scores, rank_stats = manual.image_ranker.rank(
+                cropped, image_paths_list, top_k=3, bgr=True, query_emb=region_emb
+            )
 
         # Extract page numbers from image contexts
         top_pages = list(set([image_contexts[img[0]][0] for img in scores if img[0] in image_contexts]))
 
-        # Collect chunks from top pages using pre-loaded chunks
-        all_chunks_from_pages = [
-            chunk for chunk in chunks if chunk["start_page"] in top_pages
-        ]
+        # Collect chunks from top pages through the page index
+        all_chunks_from_pages = manual.chunks.chunks_for_pages(top_pages)
 
 
-        # Re-rank chunks based on description
-        reranked_chunks = _rerank_chunks(all_chunks_from_pages, description["description"], top_k=3)
+        # Re-rank chunks by their stored embeddings against the description vector
+        reranked_chunks = _rerank_chunks(all_chunks_from_pages, description["description"], top_k=3,
+                                         bm25=manual.chunks.bm25, query_vector=query_vector,
+                                         chunk_vectors=manual.chunk_vectors)
+        print(query_cache.report())
 
 
         # Generate JSON response using pre-loaded chat session
@@ -181,9 +266,10 @@ def image(image_path, box_coordinates):
 
         if "figure_numbers" in json_response:
             image_ids = json_response["figure_numbers"]
-            image_paths = get_image_paths(image_ids)
+            image_paths = get_image_paths(image_ids, manual.content_dir)
             json_response["image_paths"] = image_paths[:2]
-            
+
+        json_response["manual_id"] = manual.manual_id
         return json_response
 
     except Exception as e:
@@ -198,6 +284,18 @@ def image(image_path, box_coordinates):
             "figure_numbers": []
         }
 
+def unknown_manual_error(manual_id):
+    """
+    Error message if manual_id does not name a processed manual, else None
+
+    A missing id (None) selects the default manual and is accepted.
+    """
+    if manual_id is None:
+        return None
+    if not isinstance(manual_id, str) or manual_id not in manuals.manual_dirs():
+        return f"Unknown manual {manual_id!r}"
+    return None
+
 # API Routes
 @app.route('/chat', methods=['POST'])
 def chat_endpoint():
@@ -207,8 +305,12 @@ def chat_endpoint():
     if not data or 'query' not in data:
         return jsonify({"error": "No query provided in request"}), 400
 
+    manual_error = unknown_manual_error(data.get('manual_id'))
+    if manual_error:
+        return jsonify({"error": manual_error}), 404
+
     query = data['query']
-    response = main(query)
+    response = main(query, manual_id=data.get('manual_id'))
     return jsonify(response)
 
 @app.route('/image', methods=['POST'])
@@ -224,6 +326,11 @@ def image_endpoint():
             print(error_msg)
             return jsonify({"error": error_msg}), 400
 
+        manual_error = unknown_manual_error(data.get('manual_id'))
+        if manual_error:
+            print(manual_error)
+            return jsonify({"error": manual_error}), 404
+
         image_path = data['image_path']
         box_coordinates = data['box']
 
@@ -234,7 +341,7 @@ def image_endpoint():
             return jsonify({"error": error_msg}), 400
 
         print(f"Calling image function with path {image_path} and box {box_coordinates}")
-        response = image(image_path, box_coordinates)
+        response = image(image_path, box_coordinates, manual_id=data.get('manual_id'))
         print(f"Response from image function: {response}")
 
         # Convert to ensure JSON serialization works
@@ -242,9 +349,9 @@ def image_endpoint():
         print("JSON response created successfully")
 
         # Retrieve image paths for the top-ranked images
-        if "figure_numbers" in response:
+        if "figure_numbers" in response and "manual_id" in response:
             image_ids = response["figure_numbers"]
-            image_paths = get_image_paths(image_ids)
+            image_paths = get_image_paths(image_ids, manuals.content_dir(response["manual_id"]))
             response["image_paths"] = image_paths[:2]
 
         json_response = jsonify(response)
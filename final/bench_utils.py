@@ -0,0 +1,28 @@
+import numpy as np
+
+
+def peak_rss_mb():
+    """Peak resident set size of the process in MB"""
+    import resource
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def sample_title_queries(chunks, n_queries, seed=0):
+    """
+    Benchmark queries: section titles of randomly picked chunks
+
+    Chunks without a section title contribute the start of their text.
+
+    Args:
+        chunks: Chunk list or ChunkStore
+        n_queries: Number of queries (at most one per chunk)
+        seed: Random seed, fixed so runs are comparable
+
+    Returns:
+        List of query strings
+    """
+    chunks = list(chunks)
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(chunks), size=min(n_queries, len(chunks)), replace=False)
+    return [chunks[i]["section_title"] or chunks[i]["text"][:80] for i in picks]
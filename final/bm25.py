@@ -0,0 +1,119 @@
+import re
+import math
+import numpy as np
+from vector_search import top_k_indices
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text):
+    """Lower-cased word tokens of a text"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 over chunk text and section titles
+
+    The inverted index stores, for every term, the chunk positions it
+    appears in and the precomputed BM25 weight of each posting, so scoring
+    a query is a few array additions. The index is never modified after
+    construction and scoring does not touch the chunk dicts, so it is safe
+    to share between request threads.
+    """
+
+    def __init__(self, chunks, k1=1.5, b=0.75, title_weight=2.0):
+        """
+        Args:
+            chunks: Chunk dicts with "id", "text" and "section_title"
+            k1: Term-frequency saturation
+            b: Length normalization
+            title_weight: How many times a title occurrence counts (titles
+                had double weight in the old term-matching reranker)
+        """
+        self.ids = [str(chunk["id"]) for chunk in chunks]
+        self.position_by_id = {}
+        term_freqs = []
+        doc_lengths = np.zeros(len(chunks), dtype=np.float32)
+
+        for position, chunk in enumerate(chunks):
+            self.position_by_id[str(chunk["id"])] = position
+            freqs = {}
+            text_tokens = tokenize(chunk.get("text", ""))
+            title_tokens = tokenize(chunk.get("section_title", ""))
+            for token in text_tokens:
+                freqs[token] = freqs.get(token, 0) + 1
+            for token in title_tokens:
+                freqs[token] = freqs.get(token, 0) + title_weight
+            term_freqs.append(freqs)
+            doc_lengths[position] = len(text_tokens) + title_weight * len(title_tokens)
+
+        self.n_docs = len(chunks)
+        avg_length = float(doc_lengths.mean()) if self.n_docs else 0.0
+        length_norm = k1 * (1 - b + b * doc_lengths / avg_length) if avg_length > 0 else np.full(self.n_docs, k1)
+
+        postings = {}
+        for position, freqs in enumerate(term_freqs):
+            for term, tf in freqs.items():
+                postings.setdefault(term, []).append((position, tf))
+
+        # term -> (positions, weights), with weights = idf * saturated tf
+        self.postings = {}
+        for term, entries in postings.items():
+            positions = np.array([p for p, _ in entries], dtype=np.int64)
+            tfs = np.array([tf for _, tf in entries], dtype=np.float32)
+            df = len(entries)
+            idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            weights = idf * tfs * (k1 + 1) / (tfs + length_norm[positions])
+            self.postings[term] = (positions, weights.astype(np.float32))
+
+    def score_all(self, query):
+        """BM25 score of every indexed chunk for a query, as a float32 array"""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is not None:
+                positions, weights = posting
+                scores[positions] += weights
+        return scores
+
+    def search(self, query, top_k=10, mask=None):
+        """
+        Best chunks of the whole corpus for a query
+
+        Args:
+            query: Search text
+            top_k: Number of results
+            mask: Optional boolean array over chunk positions; chunks outside
+                it are not returned
+
+        Returns:
+            List of (chunk id, BM25 score) tuples, best first; chunks sharing
+            no term with the query are left out
+        """
+        scores = self.score_all(query)
+        if mask is not None:
+            scores[~mask] = 0.0
+        return [(self.ids[i], float(scores[i])) for i in top_k_indices(scores, top_k) if scores[i] > 0]
+
+    def score_chunks(self, chunks, query):
+        """BM25 scores of the given chunks (0 for chunks not in the index)"""
+        all_scores = self.score_all(query)
+        positions = [self.position_by_id.get(str(chunk.get("id"))) for chunk in chunks]
+        return np.array(
+            [all_scores[p] if p is not None else 0.0 for p in positions],
+            dtype=np.float32
+        )
+
+    def rerank(self, chunks, query, top_k=3):
+        """
+        Order candidate chunks by BM25 score without modifying them
+
+        Returns:
+            List of (chunk, score) tuples, best first; ties keep input order
+        """
+        if not chunks:
+            return []
+        scores = self.score_chunks(chunks, query)
+        order = np.argsort(-scores, kind="stable")[:top_k]
+        return [(chunks[i], float(scores[i])) for i in order]
@@ -1,11 +1,21 @@
 import os
 import json
-import chromadb
 import argparse
-from chromadb.utils import embedding_functions
 from google import genai
 from dotenv import load_dotenv
 import re
+from chunk_store import ChunkStore
+from hybrid_search import HybridRetriever, split_query_variants
+from section_index import SectionIndex, COARSE_SECTIONS
+from query_encoder import encode_queries
+from vector_store import open_chroma_collection, open_vector_store
+
+# Whole-word pronouns, or an opening word that continues the previous answer
+FOLLOWUP_PATTERN = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|their)\b"
+    r"|^\s*(and|also|what about|how about|tell me more|explain|elaborate|summarize|continue|go on)\b",
+    re.IGNORECASE
+)
 
 # Load environment variables (for API keys)
 load_dotenv()
@@ -22,10 +32,17 @@ class PdfChatbot:
         """
         self.content_dir = self._find_content_dir(content_dir)
         self.chunks = []
+        self.chunk_store = None
+        self.vector_store = None
+        self.retriever = None
+        self.section_index = None
+        self.chunk_vectors = None
         self.use_chroma = use_chroma
         self.chat_history = []
         self.model_name = model_name
-        self.use_query_expansion = True
+        # LLM query expansion adds a Gemini round trip before retrieval; off
+        # unless QUERY_EXPANSION=1 (it used to fail silently, so off is the old behaviour)
+        self.use_query_expansion = os.getenv("QUERY_EXPANSION", "0") == "1"
 
         # Setup Gemini API
         api_key = os.getenv("GEMINI_API_KEY")
@@ -91,34 +108,8 @@ class PdfChatbot:
     def _setup_chromadb(self):
         """Set up the ChromaDB connection"""
         if self.use_chroma:
-            # Use persistent client with path to the chroma_db directory
-            chroma_dir = os.path.join(self.content_dir, "chroma_db")
-
-            if not os.path.exists(chroma_dir):
-                raise FileNotFoundError(
-                    f"ChromaDB directory not found at {chroma_dir}. "
-                    "Please run retrieval.py first to create the vector database."
-                )
-
-            # Initialize persistent client
-            self.chroma_client = chromadb.PersistentClient(path=chroma_dir)
-            sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-                model_name="all-MiniLM-L6-v2"
-            )
-
-            # Create or get collection
-            collection_name = f"pdf_chunks_{os.path.basename(self.content_dir)}"
-            try:
-                self.collection = self.chroma_client.get_collection(
-                    name=collection_name,
-                    embedding_function=sentence_transformer_ef
-                )
-            except Exception as e:
-                raise ValueError(
-                    f"ChromaDB collection '{collection_name}' not found or could not be accessed. "
-                    f"Error: {str(e)}. "
-                    "Please run retrieval.py first to create the collection."
-                )
+            # Existing persistent collection (created by retrieval.py)
+            self.collection = open_chroma_collection(self.content_dir, "all-MiniLM-L6-v2")
 
     def load_chunks(self):
         """Load the chunks from the JSON file"""
@@ -129,8 +120,22 @@ class PdfChatbot:
 
         with open(chunks_path, "r", encoding="utf-8") as f:
             self.chunks = json.load(f)
+        self.chunk_store = ChunkStore(self.chunks)
 
-    def _rerank_chunks(self, chunks, query, top_k=3):
+        # Store used for search, chosen with VECTOR_BACKEND (chroma, numpy or hnsw);
+        # without ChromaDB the embedded NumPy engine is used
+        self.vector_store = open_vector_store(
+            None if self.use_chroma else "numpy", self.content_dir, "all-MiniLM-L6-v2",
+            chunks=self.chunk_store, collection=self.collection if self.use_chroma else None
+        )
+        # Optional coarse tier: sections pick the candidate pages of the dense search
+        self.section_index = SectionIndex.load_or_build(self.content_dir) if COARSE_SECTIONS else None
+        self.retriever = HybridRetriever(self.chunk_store, self.vector_store.query_batch,
+                                         section_index=self.section_index)
+        # Stored chunk vectors, for reranking without re-encoding chunks
+        self.chunk_vectors = self.vector_store.embedding_index()
+
+    def _rerank_chunks(self, chunks, query, top_k=3, query_vector=None):
         """
         Re-rank chunks based on relevance to the query
         
@@ -138,72 +143,62 @@ class PdfChatbot:
             chunks: List of chunks to re-rank
             query: User query
             top_k: Number of chunks to return
+            query_vector: Query embedding; when given, chunks are ordered by
+                cosine similarity of their stored vectors, otherwise by BM25
             
         Returns:
-            List of most relevant chunks
+            List of most relevant chunks, as copies carrying a "score" key
         """
-        # Calculate relevance scores using simple term matching
-        query_terms = set(query.lower().split())
-
-        for chunk in chunks:
-            # Count term overlap between query and chunk text
-            chunk_text = chunk.get('text', '').lower()
-            matched_terms = sum(1 for term in query_terms if term in chunk_text)
-
-            # Simple scoring: term frequency + section title match bonus
-            score = matched_terms
-
-            # Add bonus for section title matches
-            section_title = chunk.get('section_title', '').lower()
-            section_match = sum(1 for term in query_terms if term in section_title)
-            score += section_match * 2  # Title matches get double weight
-
-            # Store score in chunk
-            chunk['score'] = score
-
-        # Sort by score (descending) and return top_k
-        ranked_chunks = sorted(chunks, key=lambda x: x.get('score', 0), reverse=True)
-        return ranked_chunks[:top_k]
+        if query_vector is not None and self.chunk_vectors is not None and len(self.chunk_vectors):
+            ranked = self.chunk_vectors.rerank(chunks, query_vector, top_k=top_k)
+        else:
+            ranked = self.chunk_store.bm25.rerank(chunks, query, top_k=top_k)
+        return [dict(chunk, score=score) for chunk, score in ranked]
 
-    def expand_query(self, query):
+    def expand_query(self, query, max_variants=4):
         """
-        Expand the query with synonyms and related terms
+        Expand the query into alternative phrasings
         
         Args:
             query: The original user query
+            max_variants: Maximum number of variants, original included
             
         Returns:
-            Expanded query with additional related terms
+            List of query variants, the original query first
         """
         # If query expansion is disabled, return the original query
         if not self.use_query_expansion:
-            return query
+            return [query]
 
         try:
             # Use a separate generation model for query expansion
             expansion_prompt = f"""
             I need to expand this search query to improve retrieval results: "{query}"
             
-            Please generate:
-            1. 2-3 synonymous ways to phrase the same query
-            2. 3-4 related keywords that could help in document retrieval
-            3. Any potentially disambiguating terms if the query is unclear
+            Please generate {max_variants - 1} alternative ways to phrase the same query,
+            using synonyms and related terms that could help in document retrieval.
             
-            Format the output as a single line with all terms separated by spaces.
-            Only include relevant terms, no explanations or other text.
+            Write one reformulation per line.
+            Only include the reformulations, no explanations or other text.
             """
 
-            # Generate expanded terms
-            response = self.client.generate_content(expansion_prompt)
-            expanded_terms = response.text.strip()
-
-            # Combine original query with expanded terms
-            expanded_query = f"{query} {expanded_terms}"
-            return expanded_query
+            # Generate the variants
+            response = self.client.models.generate_content(model=self.model_name, contents=expansion_prompt)
+            return split_query_variants(query, response.text, max_variants=max_variants)
 
         except Exception:
             # Fall back to original query if expansion fails
-            return query
+            return [query]
+
+    def referenced_pages(self, query):
+        """Page numbers the query refers to, like "page 5" or "p. 10" """
+        pages = []
+        for page_ref in re.findall(r'\bpage\s+(\d+)|\bp\.\s*(\d+)', query, re.IGNORECASE):
+            # Each match is a tuple with groups, only one will have content
+            page_num = next((int(p) for p in page_ref if p), None)
+            if page_num:
+                pages.append(page_num)
+        return pages
 
     def retrieve_context(self, query, top_k=3):
         """
@@ -216,70 +211,33 @@ class PdfChatbot:
         Returns:
             List of context chunks
         """
-        if self.use_chroma:
-            # Expand the query to improve retrieval
-            expanded_query = self.expand_query(query)
-
-            # Use ChromaDB for search with the expanded query
-            results = self.collection.query(
-                query_texts=[expanded_query],
-                n_results=top_k * 2  # Retrieve more results initially as we'll filter them later
-            )
-
-            # Format results to match the original format
-            contexts = []
-            for i, doc_id in enumerate(results["ids"][0]):
-                # Find original chunk
-                for chunk in self.chunks:
-                    if str(chunk["id"]) == doc_id:
-                        contexts.append({
-                            "text": chunk["text"],
-                            "section_title": chunk["section_title"],
-                            "start_page": chunk["start_page"],
-                            "score": float(results["distances"][0][i]) if "distances" in results else 0.0
-                        })
-                        break
-
-            # Extract the start pages of the top chunks
-            top_pages = [ctx["start_page"] for ctx in contexts[:5]]
+        if self.retriever is not None:
+            # Expand the query into variants to improve retrieval
+            variants = self.expand_query(query)
+
+            # Embed all variants in one batch; the vectors go to the vector store in one
+            # call and the original query's vector is reused for reranking
+            query_vectors = encode_queries(variants)
+            query_vector = query_vectors[0]
+
+            # Dense (vector store) and BM25 search per variant, fused with reciprocal rank fusion
+            contexts = self.retriever.search_variants(variants, top_k=5, query_vectors=query_vectors)
+
+            # Extract the start pages of the top chunks; pages named in the query
+            # ("page 5", "p. 10") are added to them, not used as a filter, so a
+            # misread reference only widens the rerank pool
+            top_pages = [ctx["start_page"] for ctx in contexts]
+            top_pages += [page for page in self.referenced_pages(query) if page not in top_pages]
 
             # Collect all chunks from the top pages
-            all_chunks_from_pages = [
-                chunk for chunk in self.chunks if chunk["start_page"] in top_pages
-            ]
-
-            # Re-rank with the original query to ensure relevance
-            reranked = self._rerank_chunks(all_chunks_from_pages, query, top_k=top_k)
-
-            # Check if query refers to specific pages like "page 5" or "p. 10"
-            page_references = re.findall(r'page\s+(\d+)|p\.\s*(\d+)', query, re.IGNORECASE)
-            referenced_pages = []
-
-            # Extract referenced page numbers
-            for page_ref in page_references:
-                # Each match is a tuple with groups, only one will have content
-                page_num = next((int(p) for p in page_ref if p), None)
-                if page_num:
-                    referenced_pages.append(page_num)
-
-            # Add chunks from explicitly referenced pages if they're not already included
-            # Track if we added new pages
-            new_pages_added = False
-            for page_num in referenced_pages:
-                if page_num not in top_pages:
-                    # Add chunks from this page to all_chunks_from_pages
-                    page_chunks = [chunk for chunk in self.chunks if chunk["start_page"] == page_num]
-                    all_chunks_from_pages.extend(page_chunks)
-                    top_pages.append(page_num)  # Add to top_pages to track inclusion
-                    new_pages_added = True
-
-            # Rerank again if new pages were added
-            if new_pages_added:
-                reranked = self._rerank_chunks(all_chunks_from_pages, query, top_k=top_k)
+            all_chunks_from_pages = self.chunk_store.chunks_for_pages(top_pages)
+
+            # Re-rank against the stored chunk vectors with the same query vector
+            reranked = self._rerank_chunks(all_chunks_from_pages, query, top_k=top_k, query_vector=query_vector)
 
             return reranked[:top_k]  # Return only the top_k most relevant chunks
         else:
-            raise ValueError("ChromaDB is required for context retrieval")
+            raise ValueError("A vector store is required for context retrieval")
 
     def format_context_for_prompt(self, contexts):
         """Format retrieved contexts for the prompt"""
@@ -328,18 +286,14 @@ class PdfChatbot:
             return f"Error generating response: {str(e)}"
 
     def is_followup_question(self, query):
-        """Check if the query is likely a follow-up question"""
-        followup_indicators = [
-            "it", "this", "that", "these", "those", "the", "they", "them",
-            "their", "he", "she", "his", "her", "what about", "how about",
-            "can you", "tell me more", "explain", "elaborate", "summarize",
-            "resume", "continue", "go on", "and", "also", "additionally"
-        ]
-
-        query_lower = query.lower()
-        # Check if query is short or contains followup indicators
-        return (len(query.split()) <= 5 or
-                any(indicator in query_lower for indicator in followup_indicators))
+        """
+        Check if the query refers back to the previous answer
+
+        Only possible once the chatbot has answered something; then the query
+        must use a pronoun ("does it ...") or open with a continuation
+        ("and the rear seats?", "tell me more").
+        """
+        return bool(self.current_context) and FOLLOWUP_PATTERN.search(query) is not None
 
 def get_response_json(content_dir=None, model_name="gemini-2.0-flash", top_k=3):
     """
@@ -0,0 +1,209 @@
+import os
+import json
+import numpy as np
+from bm25 import BM25Index
+
+
+def end_pages(start_pages):
+    """
+    Last page of each item of a list ordered by start page
+
+    An item is taken to run until the page before the next item with a later
+    start page (or to its own start page when the next one starts on the
+    same page).
+    """
+    ends = []
+    next_start = None
+    for start in reversed(start_pages):
+        ends.append(start if next_start is None else max(start, next_start - 1))
+        if next_start is None or start < next_start:
+            next_start = start
+    ends.reverse()
+    return ends
+
+
+def chunk_metadata(chunks):
+    """
+    Typed metadata of each chunk, as stored with its vector
+
+    end_page is not in rag_chunks.json; it is derived with end_pages.
+
+    Returns:
+        List of dicts with section_id (str), section_title (str),
+        start_page (int), end_page (int), chunk_index (int) and n_images (int)
+    """
+    start_pages = [int(chunk["start_page"]) for chunk in chunks]
+    return [
+        {
+            "section_id": str(chunk.get("section_id", "")),
+            "section_title": str(chunk.get("section_title", "")),
+            "start_page": start,
+            "end_page": end,
+            "chunk_index": int(chunk.get("chunk_index", 0)),
+            "n_images": len(chunk.get("images") or []),
+        }
+        for chunk, start, end in zip(chunks, start_pages, end_pages(start_pages))
+    ]
+
+
+def page_ranges(pages):
+    """Sorted, merged (first, last) ranges covering a set of page numbers"""
+    ranges = []
+    for page in sorted(set(int(p) for p in pages)):
+        if ranges and page == ranges[-1][1] + 1:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    return [tuple(r) for r in ranges]
+
+
+class ChunkFilter:
+    """
+    Page and section constraint for a vector query
+
+    Translates to a Chroma where clause for the Chroma backend and to a row
+    mask for the embedded engines, so only matching chunks are scored.
+    """
+
+    def __init__(self, pages=None, section_ids=None):
+        """
+        Args:
+            pages: Page numbers; a chunk matches if its page range covers one
+            section_ids: Section ids; a chunk matches if it belongs to one
+        """
+        self.page_ranges = page_ranges(pages) if pages else []
+        self.section_ids = sorted(set(str(s) for s in section_ids)) if section_ids else []
+
+    def __bool__(self):
+        return bool(self.page_ranges or self.section_ids)
+
+    def __repr__(self):
+        return f"ChunkFilter(page_ranges={self.page_ranges}, section_ids={self.section_ids})"
+
+    def where(self):
+        """Chroma where clause, or None when the filter is empty"""
+        clauses = []
+        page_clauses = [
+            {"$and": [{"start_page": {"$lte": last}}, {"end_page": {"$gte": first}}]}
+            for first, last in self.page_ranges
+        ]
+        if len(page_clauses) == 1:
+            clauses.append(page_clauses[0])
+        elif page_clauses:
+            clauses.append({"$or": page_clauses})
+        if self.section_ids:
+            clauses.append({"section_id": {"$in": self.section_ids}})
+
+        if not clauses:
+            return None
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def mask(self, columns):
+        """
+        Boolean row mask over metadata columns
+
+        Args:
+            columns: Dict with "start_page", "end_page" (int arrays) and
+                "section_id" (str array), as ChunkStore.columns_for_ids returns
+        """
+        mask = np.ones(len(columns["start_page"]), dtype=bool)
+        if self.page_ranges:
+            in_pages = np.zeros_like(mask)
+            for first, last in self.page_ranges:
+                in_pages |= (columns["start_page"] <= last) & (columns["end_page"] >= first)
+            mask &= in_pages
+        if self.section_ids:
+            mask &= np.isin(columns["section_id"], self.section_ids)
+        return mask
+
+
+class ChunkStore:
+    """RAG chunks of a manual with id -> chunk, page -> chunks and BM25 indexes"""
+
+    def __init__(self, chunks):
+        """
+        Args:
+            chunks: List of chunk dicts as written to rag_chunks.json
+        """
+        self.chunks = chunks
+        self.by_id = {str(chunk["id"]): chunk for chunk in chunks}
+
+        # Posting lists keep corpus positions so results come back in file order
+        self.by_page = {}
+        for position, chunk in enumerate(chunks):
+            self.by_page.setdefault(chunk["start_page"], []).append(position)
+
+        # Built once per load; read-only afterwards, so rerankers can share it
+        self.bm25 = BM25Index(chunks)
+
+        # Typed metadata (page range, section) aligned with the chunk list
+        self.metadata = chunk_metadata(chunks)
+        self.metadata_by_id = {str(chunk["id"]): meta for chunk, meta in zip(chunks, self.metadata)}
+        self.columns = self.columns_for_ids([str(chunk["id"]) for chunk in chunks])
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def __contains__(self, chunk_id):
+        return str(chunk_id) in self.by_id
+
+    @classmethod
+    def load(cls, content_dir):
+        """
+        Load rag_chunks.json from a content directory
+
+        Returns:
+            ChunkStore, or None if the file does not exist
+        """
+        chunks_path = os.path.join(content_dir, "rag_chunks.json")
+        if not os.path.exists(chunks_path):
+            return None
+
+        with open(chunks_path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def columns_for_ids(self, ids):
+        """
+        Metadata columns aligned with a list of chunk ids (e.g. vector index rows)
+
+        Unknown ids get page -1 and an empty section, so no filter matches them.
+        """
+        missing = {"start_page": -1, "end_page": -1, "section_id": ""}
+        metas = [self.metadata_by_id.get(str(doc_id), missing) for doc_id in ids]
+        return {
+            "start_page": np.array([m["start_page"] for m in metas], dtype=np.int32),
+            "end_page": np.array([m["end_page"] for m in metas], dtype=np.int32),
+            "section_id": np.array([m["section_id"] for m in metas], dtype=object),
+        }
+
+    def get(self, chunk_id):
+        """Chunk with the given id, or None"""
+        return self.by_id.get(str(chunk_id))
+
+    def pages(self):
+        """Page numbers that have at least one chunk"""
+        return self.by_page.keys()
+
+    def chunks_for_pages(self, pages):
+        """
+        Chunks starting on any of the given pages
+
+        Costs O(result size): only the posting lists of those pages are read.
+        Chunks come back in corpus order, as a scan of the chunk list would
+        return them.
+        """
+        positions = []
+        for page in set(pages):
+            positions.extend(self.by_page.get(page, ()))
+        positions.sort()
+        return [self.chunks[i] for i in positions]
+
+
+def as_chunk_store(chunks):
+    """Wrap a plain chunk list in a ChunkStore; stores are returned unchanged"""
+    if chunks is None or isinstance(chunks, ChunkStore):
+        return chunks
+    return ChunkStore(chunks)
@@ -0,0 +1,343 @@
+import os
+import time
+import argparse
+import numpy as np
+from onnx_utils import make_session, quantize_int8
+from bench_utils import peak_rss_mb, sample_title_queries
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_MODEL_NAME = "openai/clip-vit-base-patch32"
+DEFAULT_ONNX_DIR = os.path.join(script_dir, "onnx_models")
+DEFAULT_ONNX_PATH = os.path.join(DEFAULT_ONNX_DIR, "clip_image_int8.onnx")
+DEFAULT_TEXT_ONNX_PATH = os.path.join(DEFAULT_ONNX_DIR, "clip_text_int8.onnx")
+
+
+class OnnxClipImageEncoder:
+    """CLIP image tower (vision model + projection) running on ONNX Runtime"""
+
+    def __init__(self, model_path=DEFAULT_ONNX_PATH, num_threads=None):
+        """
+        Args:
+            model_path: Exported .onnx file (see export_image_tower)
+            num_threads: Intra-op threads, defaults to ONNX Runtime's choice
+        """
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"ONNX CLIP model not found at {model_path}. "
+                "Run 'python clip_onnx.py export' first."
+            )
+
+        self.model_path = model_path
+        self.session = make_session(model_path, num_threads=num_threads)
+        self.input_name = self.session.get_inputs()[0].name
+        self.embedding_dim = self.session.get_outputs()[0].shape[-1]
+
+    def encode(self, pixel_values):
+        """
+        Args:
+            pixel_values: float32 array (n, 3, 224, 224) from CLIPProcessor
+
+        Returns:
+            L2-normalized float32 embeddings of shape (n, dim)
+        """
+        pixel_values = np.ascontiguousarray(pixel_values, dtype=np.float32)
+        return self.session.run(None, {self.input_name: pixel_values})[0]
+
+
+class OnnxClipTextEncoder:
+    """CLIP text tower (text model + projection) running on ONNX Runtime"""
+
+    def __init__(self, model_path=DEFAULT_TEXT_ONNX_PATH, model_name=DEFAULT_MODEL_NAME, num_threads=None):
+        """
+        Args:
+            model_path: Exported .onnx file (see export_text_tower)
+            model_name: Checkpoint whose tokenizer matches the export
+            num_threads: Intra-op threads, defaults to ONNX Runtime's choice
+        """
+        from transformers import CLIPTokenizerFast
+
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(
+                f"ONNX CLIP text model not found at {model_path}. "
+                "Run 'python clip_onnx.py export' first."
+            )
+
+        self.model_path = model_path
+        # Only the tokenizer is loaded, never the PyTorch weights
+        self.tokenizer = CLIPTokenizerFast.from_pretrained(model_name)
+        self.session = make_session(model_path, num_threads=num_threads)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts):
+        """
+        Args:
+            texts: List of strings
+
+        Returns:
+            L2-normalized float32 embeddings of shape (n, dim)
+        """
+        inputs = self.tokenizer(list(texts), padding=True, truncation=True, return_tensors="np")
+        feed = {name: np.asarray(inputs[name], dtype=np.int64) for name in ("input_ids", "attention_mask")
+                if name in self.input_names}
+        return self.session.run(None, feed)[0]
+
+
+def export_image_tower(output_path=DEFAULT_ONNX_PATH, model_name=DEFAULT_MODEL_NAME, quantize=True):
+    """
+    Export the CLIP image tower to ONNX and optionally quantize it to int8
+
+    The exported graph includes the projection and the L2 normalization, so
+    its output is directly comparable with get_image_features embeddings.
+
+    Args:
+        output_path: Destination .onnx file
+        model_name: Hugging Face CLIP checkpoint
+        quantize: Apply dynamic int8 weight quantization
+
+    Returns:
+        Path of the written model
+    """
+    import torch
+    from transformers import CLIPModel
+
+    class ImageTower(torch.nn.Module):
+        def __init__(self, clip_model):
+            super().__init__()
+            self.vision_model = clip_model.vision_model
+            self.visual_projection = clip_model.visual_projection
+
+        def forward(self, pixel_values):
+            pooled = self.vision_model(pixel_values=pixel_values).pooler_output
+            embeddings = self.visual_projection(pooled)
+            return embeddings / embeddings.norm(p=2, dim=-1, keepdim=True)
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    clip_model = CLIPModel.from_pretrained(model_name).eval()
+    image_size = clip_model.config.vision_config.image_size
+    fp32_path = output_path.replace(".onnx", "_fp32.onnx") if quantize else output_path
+
+    torch.onnx.export(
+        ImageTower(clip_model),
+        torch.zeros(1, 3, image_size, image_size),
+        fp32_path,
+        input_names=["pixel_values"],
+        output_names=["image_embeds"],
+        dynamic_axes={"pixel_values": {0: "batch"}, "image_embeds": {0: "batch"}},
+        opset_version=17,
+    )
+    print(f"Exported FP32 image tower to {fp32_path}")
+
+    if quantize:
+        quantize_int8(fp32_path, output_path)
+        print(f"Quantized int8 image tower written to {output_path}")
+
+    return output_path
+
+
+def export_text_tower(output_path=DEFAULT_TEXT_ONNX_PATH, model_name=DEFAULT_MODEL_NAME, quantize=True):
+    """
+    Export the CLIP text tower to ONNX and optionally quantize it to int8
+
+    Like export_image_tower, the graph includes the projection and the L2
+    normalization, matching get_text_features followed by normalization.
+
+    Returns:
+        Path of the written model
+    """
+    import torch
+    from transformers import CLIPModel, CLIPTokenizerFast
+
+    class TextTower(torch.nn.Module):
+        def __init__(self, clip_model):
+            super().__init__()
+            self.text_model = clip_model.text_model
+            self.text_projection = clip_model.text_projection
+
+        def forward(self, input_ids, attention_mask):
+            pooled = self.text_model(input_ids=input_ids, attention_mask=attention_mask).pooler_output
+            embeddings = self.text_projection(pooled)
+            return embeddings / embeddings.norm(p=2, dim=-1, keepdim=True)
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    clip_model = CLIPModel.from_pretrained(model_name).eval()
+    dummy = CLIPTokenizerFast.from_pretrained(model_name)(["a photo of the dashboard"], return_tensors="pt")
+    fp32_path = output_path.replace(".onnx", "_fp32.onnx") if quantize else output_path
+
+    torch.onnx.export(
+        TextTower(clip_model),
+        (dummy["input_ids"], dummy["attention_mask"]),
+        fp32_path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["text_embeds"],
+        dynamic_axes={"input_ids": {0: "batch", 1: "sequence"}, "attention_mask": {0: "batch", 1: "sequence"},
+                      "text_embeds": {0: "batch"}},
+        opset_version=17,
+    )
+    print(f"Exported FP32 text tower to {fp32_path}")
+
+    if quantize:
+        quantize_int8(fp32_path, output_path)
+        print(f"Quantized int8 text tower written to {output_path}")
+
+    return output_path
+
+
+def check_text_parity(onnx_path, content_dir, n_texts=64, model_name=DEFAULT_MODEL_NAME, min_cosine=0.98):
+    """
+    Compare ONNX text embeddings against the PyTorch ones on section titles
+
+    Returns:
+        True if every cosine is at least min_cosine
+    """
+    import json
+    import torch
+    from transformers import CLIPModel, CLIPTokenizerFast
+
+    with open(os.path.join(content_dir, "rag_chunks.json"), "r", encoding="utf-8") as f:
+        texts = sample_title_queries(json.load(f), n_texts)
+
+    clip_model = CLIPModel.from_pretrained(model_name).eval()
+    inputs = CLIPTokenizerFast.from_pretrained(model_name)(texts, padding=True, truncation=True, return_tensors="pt")
+    with torch.no_grad():
+        reference = clip_model.get_text_features(**inputs)
+        reference = (reference / reference.norm(p=2, dim=-1, keepdim=True)).numpy()
+
+    candidate = OnnxClipTextEncoder(onnx_path, model_name=model_name).encode(texts)
+    cosines = np.sum(reference * candidate, axis=1)
+    print(f"Texts compared: {len(texts)}")
+    print(f"Text cosine torch vs onnx: min {cosines.min():.4f}, mean {cosines.mean():.4f}")
+
+    passed = bool(cosines.min() >= min_cosine)
+    print("Text parity OK" if passed else f"Text parity FAILED (min cosine < {min_cosine})")
+    return passed
+
+
+def _sample_images(content_dir, n_images):
+    images_dir = os.path.join(content_dir, "images")
+    names = sorted(n for n in os.listdir(images_dir) if n.lower().endswith((".png", ".jpg", ".jpeg")))
+    return [os.path.join(images_dir, n) for n in names[:n_images]]
+
+
+def _pixel_values(paths, model_name):
+    from PIL import Image
+    from transformers import CLIPProcessor
+
+    processor = CLIPProcessor.from_pretrained(model_name)
+    images = [Image.open(p).convert("RGB") for p in paths]
+    return processor(images=images, return_tensors="np")["pixel_values"].astype(np.float32)
+
+
+def check_parity(onnx_path, content_dir, n_images=32, model_name=DEFAULT_MODEL_NAME, min_cosine=0.98):
+    """
+    Compare ONNX embeddings against the PyTorch ones on manual images
+
+    Reports the cosine between both embeddings of each image and whether
+    the nearest neighbour of each image (among the sample) is unchanged.
+
+    Returns:
+        True if every cosine is at least min_cosine
+    """
+    import torch
+    from transformers import CLIPModel
+
+    paths = _sample_images(content_dir, n_images)
+    pixel_values = _pixel_values(paths, model_name)
+
+    clip_model = CLIPModel.from_pretrained(model_name).eval()
+    with torch.no_grad():
+        reference = clip_model.get_image_features(pixel_values=torch.from_numpy(pixel_values))
+        reference = (reference / reference.norm(p=2, dim=-1, keepdim=True)).numpy()
+
+    candidate = OnnxClipImageEncoder(onnx_path).encode(pixel_values)
+
+    cosines = np.sum(reference * candidate, axis=1)
+    ref_sim = reference @ reference.T
+    cand_sim = candidate @ candidate.T
+    np.fill_diagonal(ref_sim, -np.inf)
+    np.fill_diagonal(cand_sim, -np.inf)
+    nn_agreement = np.mean(ref_sim.argmax(axis=1) == cand_sim.argmax(axis=1))
+
+    print(f"Images compared: {len(paths)}")
+    print(f"Cosine torch vs onnx: min {cosines.min():.4f}, mean {cosines.mean():.4f}")
+    print(f"Nearest-neighbour agreement: {nn_agreement:.1%}")
+
+    passed = bool(cosines.min() >= min_cosine)
+    print("Parity OK" if passed else f"Parity FAILED (min cosine < {min_cosine})")
+    return passed
+
+
+def benchmark(backend, content_dir, onnx_path=DEFAULT_ONNX_PATH, batch_sizes=(1, 8, 32), repeats=10,
+              model_name=DEFAULT_MODEL_NAME):
+    """
+    Measure image-encoding latency and peak RSS of one backend
+
+    Run once per backend in separate processes so RSS figures are comparable.
+    """
+    max_batch = max(batch_sizes)
+    pixel_values = _pixel_values(_sample_images(content_dir, max_batch), model_name)
+    if len(pixel_values) < max_batch:
+        pixel_values = np.resize(pixel_values, (max_batch,) + pixel_values.shape[1:])
+
+    if backend == "onnx":
+        encoder = OnnxClipImageEncoder(onnx_path)
+        encode = encoder.encode
+    else:
+        import torch
+        from transformers import CLIPModel
+
+        clip_model = CLIPModel.from_pretrained(model_name).eval()
+
+        def encode(batch):
+            with torch.no_grad():
+                return clip_model.get_image_features(pixel_values=torch.from_numpy(batch)).numpy()
+
+    print(f"Backend: {backend}")
+    for batch_size in batch_sizes:
+        batch = pixel_values[:batch_size]
+        encode(batch)  # warm-up
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            encode(batch)
+            timings.append(time.perf_counter() - start)
+        median = float(np.median(timings))
+        print(f"  batch {batch_size:>3}: {median * 1000:8.1f} ms/batch, "
+              f"{batch_size / median:7.1f} images/s")
+    print(f"  peak RSS: {peak_rss_mb():.0f} MB")
+
+
+def main():
+    default_content_dir = os.path.join(os.path.dirname(script_dir), "extracted_content_manual")
+    parser = argparse.ArgumentParser(description="ONNX Runtime backend for the CLIP image encoder")
+    parser.add_argument("--onnx_path", default=DEFAULT_ONNX_PATH, help="Path of the ONNX image model")
+    parser.add_argument("--text_onnx_path", default=DEFAULT_TEXT_ONNX_PATH, help="Path of the ONNX text model")
+    parser.add_argument("--content_dir", "-d", default=default_content_dir, help="Directory with extracted content")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export (and quantize) the image and text towers")
+    export_parser.add_argument("--no-quantize", action="store_true", help="Keep FP32 weights")
+
+    parity_parser = subparsers.add_parser("parity", help="Compare ONNX and PyTorch embeddings")
+    parity_parser.add_argument("--n_images", type=int, default=32, help="Number of manual images to compare")
+    parity_parser.add_argument("--min_cosine", type=float, default=0.98, help="Minimum accepted cosine")
+
+    bench_parser = subparsers.add_parser("benchmark", help="Measure latency and RSS of a backend")
+    bench_parser.add_argument("--backend", choices=["torch", "onnx"], default="onnx")
+    bench_parser.add_argument("--repeats", type=int, default=10, help="Timed runs per batch size")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_image_tower(args.onnx_path, quantize=not args.no_quantize)
+        export_text_tower(args.text_onnx_path, quantize=not args.no_quantize)
+    elif args.command == "parity":
+        image_ok = check_parity(args.onnx_path, args.content_dir, args.n_images, min_cosine=args.min_cosine)
+        text_ok = check_text_parity(args.text_onnx_path, args.content_dir, min_cosine=args.min_cosine)
+        if not (image_ok and text_ok):
+            raise SystemExit(1)
+    else:
+        benchmark(args.backend, args.content_dir, onnx_path=args.onnx_path, repeats=args.repeats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import os
+import json
+import hashlib
+import threading
+from types import MappingProxyType
+
+EXTRACTED_CONTENT_FILENAME = "extracted_content.json"
+CONTENT_FILENAMES = (EXTRACTED_CONTENT_FILENAME, "rag_chunks.json")
+
+
+def content_version(content_dir, filenames=CONTENT_FILENAMES):
+    """
+    Cheap fingerprint of a manual's content files
+
+    Built from each file's size and modification time, so checking it costs
+    a few stat calls instead of a parse.
+    """
+    parts = []
+    for name in filenames:
+        try:
+            stat = os.stat(os.path.join(content_dir, name))
+            parts.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+        except FileNotFoundError:
+            parts.append(f"{name}:missing")
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+class PageImageIndex:
+    """
+    Images of extracted_content.json indexed by page number
+
+    Instances are read-only after construction, so one instance can be
+    shared by every request thread.
+    """
+
+    def __init__(self, pages, version=None):
+        """
+        Args:
+            pages: Page dicts as written to extracted_content.json
+            version: content_version of the file the pages came from
+        """
+        self.version = version
+        # page -> ((image_path, nearby_text), ...), pages kept in file order
+        self.images_by_page = {}
+        self.page_position = {}
+        for position, page in enumerate(pages):
+            page_num = page.get("page_num")
+            images = page.get("images")
+            if not images:
+                continue
+            self.page_position.setdefault(page_num, position)
+            entries = self.images_by_page.setdefault(page_num, [])
+            entries.extend((image["path"], image["nearby_text"]) for image in images)
+
+        self.images_by_page = MappingProxyType(
+            {page: tuple(entries) for page, entries in self.images_by_page.items()}
+        )
+        self.page_position = MappingProxyType(self.page_position)
+
+    def __len__(self):
+        return sum(len(entries) for entries in self.images_by_page.values())
+
+    @classmethod
+    def load(cls, content_dir):
+        """Build the index from <content_dir>/extracted_content.json"""
+        extracted_content_path = os.path.join(content_dir, EXTRACTED_CONTENT_FILENAME)
+        if not os.path.exists(extracted_content_path):
+            raise FileNotFoundError(f"File not found: {extracted_content_path}")
+
+        version = content_version(content_dir, (EXTRACTED_CONTENT_FILENAME,))
+        with open(extracted_content_path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), version=version)
+
+    def images_for_pages(self, pages):
+        """
+        Images on any of the given pages
+
+        Costs O(result size). Pages are visited in file order, matching a
+        scan of extracted_content.json.
+
+        Returns:
+            Tuple (image_paths, image_contexts): list of image paths and a
+            dict path -> (page_num, nearby_text)
+        """
+        found = sorted((p for p in set(pages) if p in self.images_by_page), key=self.page_position.get)
+
+        image_paths = []
+        image_contexts = {}
+        for page_num in found:
+            for path, nearby_text in self.images_by_page[page_num]:
+                image_paths.append(path)
+                image_contexts[path] = (page_num, nearby_text)
+        return image_paths, image_contexts
+
+
+class PageImageIndexLoader:
+    """
+    Keeps one resident PageImageIndex per content directory
+
+    get() stats extracted_content.json and only re-parses it when its
+    version changed; otherwise it returns the same immutable index.
+    """
+
+    def __init__(self, content_dir):
+        self.content_dir = content_dir
+        self._index = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Current PageImageIndex, reloaded if the content changed on disk"""
+        version = content_version(self.content_dir, (EXTRACTED_CONTENT_FILENAME,))
+        index = self._index
+        if index is not None and index.version == version:
+            return index
+
+        with self._lock:
+            if self._index is None or self._index.version != version:
+                self._index = PageImageIndex.load(self.content_dir)
+                print(f"Loaded page image index ({len(self._index)} images, version {self._index.version})")
+            return self._index
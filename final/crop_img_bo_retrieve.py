@@ -4,12 +4,16 @@ import os
 from PIL import Image
 import google.generativeai as genai
 from dotenv import load_dotenv
-import chromadb
-from chromadb.utils import embedding_functions
-from sentence_transformers import SentenceTransformer
 import re  # Added for regex pattern matching
 import json  # Added for JSON handling
 from similarity_img import rank_similar_images  # Import the ranking function from similarity_img.py
+from model_registry import get_text_encoder
+from chunk_store import ChunkStore, as_chunk_store
+from content_index import PageImageIndex
+from bm25 import BM25Index
+from hybrid_search import HybridRetriever, split_query_variants
+from query_encoder import encode_query
+from vector_store import open_chroma_collection, open_vector_store, as_vector_store
 
 class DashboardImageProcessor:
     """Class to handle processing dashboard images with Gemini API and ChromaDB"""
@@ -42,44 +46,22 @@ class DashboardImageProcessor:
             content_dir: Directory where the ChromaDB is stored
             
         Returns:
-            Tuple containing (collection, sentence_transformer_model)
+            Tuple containing (collection, sentence_transformer_model); the
+            configured VectorStore is kept in self.vector_store
         """
-        # Use persistent client with path to the chroma_db directory
-        chroma_dir = os.path.join(content_dir, "chroma_db")
+        # Shared sentence transformer (one copy per process, also used by the embedding function)
+        sentence_transformer_model = get_text_encoder("all-MiniLM-L6-v2")
 
-        if not os.path.exists(chroma_dir):
-            raise FileNotFoundError(
-                f"ChromaDB directory not found at {chroma_dir}. "
-                "Please run retrieval.py first to create the vector database."
-            )
-
-        # Initialize persistent client
-        chroma_client = chromadb.PersistentClient(path=chroma_dir)
-
-        # Initialize the sentence transformer model
-        sentence_transformer_model = SentenceTransformer("all-MiniLM-L6-v2")
-
-        sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name="all-MiniLM-L6-v2"
-        )
-
-        # Create or get collection
-        collection_name = f"pdf_chunks_{os.path.basename(content_dir)}"
-        try:
-            collection = chroma_client.get_collection(
-                name=collection_name,
-                embedding_function=sentence_transformer_ef
-            )
-            print(f"Connected to existing persistent ChromaDB collection: {collection_name}")
-        except Exception as e:
-            raise ValueError(
-                f"ChromaDB collection '{collection_name}' not found or could not be accessed. "
-                f"Error: {str(e)}. "
-                "Please run retrieval.py first to create the collection."
-            )
+        # Existing persistent collection (created by retrieval.py)
+        collection = open_chroma_collection(content_dir, "all-MiniLM-L6-v2")
 
         self.text_col = collection
         self.model_text = sentence_transformer_model
+        # Store used for search, chosen with VECTOR_BACKEND (chroma, numpy or hnsw)
+        self.vector_store = open_vector_store(None, content_dir, "all-MiniLM-L6-v2", collection=collection)
+        print(f"Searching with the {self.vector_store.name} vector store")
+        # Stored chunk vectors, for reranking without re-encoding chunks
+        self.chunk_vectors = self.vector_store.embedding_index()
         return collection, sentence_transformer_model
 
     def load_chunks(self, content_dir):
@@ -89,12 +71,11 @@ class DashboardImageProcessor:
             content_dir: Directory with extracted content
             
         Returns:
-            List of chunks if successful, None otherwise
+            ChunkStore (iterable like the chunk list, with an id index) if
+            successful, None otherwise
         """
-        chunks_path = os.path.join(content_dir, "rag_chunks.json")
-        if os.path.exists(chunks_path):
-            with open(chunks_path, "r", encoding="utf-8") as f:
-                self.chunks = json.load(f)
+        self.chunks = ChunkStore.load(content_dir)
+        if self.chunks is not None:
             print(f"Loaded {len(self.chunks)} chunks for retrieval")
             return self.chunks
         else:
@@ -127,15 +108,17 @@ class DashboardImageProcessor:
 
         return cropped_image
 
-    def expand_query(self, query):
+    def expand_query(self, query, max_variants=4):
         """
-        Expand the query with synonyms and related terms
+        Expand the query into alternative phrasings
         
         Args:
             query: The original query
+            max_variants: Maximum number of variants, original included
             
         Returns:
-            Expanded query with additional related terms
+            List of query variants, the original query first (for
+            HybridRetriever.search_variants)
         """
         try:
             if not self.model:
@@ -145,31 +128,26 @@ class DashboardImageProcessor:
             expansion_prompt = f"""
             I need to expand this search query to improve retrieval results: "{query}"
             
-            Please generate:
-            1. 2-3 synonymous ways to phrase the same query
-            2. 3-4 related keywords that could help in document retrieval
-            3. Any potentially disambiguating terms if the query is unclear
+            Please generate {max_variants - 1} alternative ways to phrase the same query,
+            using synonyms and related terms that could help in document retrieval.
             
-            Format the output as a single line with all terms separated by spaces.
-            Only include relevant terms, no explanations or other text.
+            Write one reformulation per line.
+            Only include the reformulations, no explanations or other text.
             """
 
-            # Generate expanded terms
+            # Generate the variants
             response = self.model.generate_content(expansion_prompt)
-            expanded_terms = response.text.strip()
-
-            # Combine original query with expanded terms
-            expanded_query = f"{query} {expanded_terms}"
+            variants = split_query_variants(query, response.text, max_variants=max_variants)
 
             print(f"Original query: {query}")
-            print(f"Expanded query: {expanded_query}")
+            print(f"Query variants: {variants}")
 
-            return expanded_query
+            return variants
 
         except Exception as e:
             print(f"Query expansion error: {str(e)}")
             # Fall back to original query if expansion fails
-            return query
+            return [query]
 
     # Add the other methods following the same pattern...
 
@@ -254,99 +232,68 @@ class DashboardImageProcessor:
         except Exception as e:
             return f"Error processing image with Gemini API: {str(e)}\n\nTip: Make sure GOOGLE_API_KEY is correctly set in your .env file."
 
-def _rerank_chunks(chunks, query, top_k=3):
+def _rerank_chunks(chunks, query, top_k=3, bm25=None, query_vector=None, chunk_vectors=None):
     """
     Re-rank chunks based on relevance to the query
     
+    With query_vector and chunk_vectors the chunks are ordered by cosine
+    similarity to their stored embeddings (one gather and one product, no
+    model call); otherwise by BM25.
+    
     Args:
         chunks: List of chunks to re-rank
         query: User query
         top_k: Number of chunks to return
+        bm25: BM25Index of the whole manual (ChunkStore.bm25); if None an
+            index is built over the given chunks only
+        query_vector: Embedding of the query, as used for retrieval
+        chunk_vectors: NumpyVectorIndex of the stored chunk embeddings
         
     Returns:
-        List of most relevant chunks
+        List of most relevant chunks, as copies carrying a "score" key (the
+        input chunk dicts are not modified)
     """
-    # Calculate relevance scores using simple term matching
-    query_terms = set(query.lower().split())
-
-    for chunk in chunks:
-        # Count term overlap between query and chunk text
-        chunk_text = chunk.get('text', '').lower()
-        matched_terms = sum(1 for term in query_terms if term in chunk_text)
-
-        # Simple scoring: term frequency + section title match bonus
-        score = matched_terms
-
-        # Add bonus for section title matches
-        section_title = chunk.get('section_title', '').lower()
-        section_match = sum(1 for term in query_terms if term in section_title)
-        score += section_match * 2  # Title matches get double weight
-
-        # Store score in chunk
-        chunk['score'] = score
-
-    # Sort by score (descending) and return top_k
-    ranked_chunks = sorted(chunks, key=lambda x: x.get('score', 0), reverse=True)
-    return ranked_chunks[:top_k]
-
-def retrieve_context(query, top_k=15, collection=None, chunks=None):
+    if query_vector is not None and chunk_vectors is not None and len(chunk_vectors):
+        ranked = chunk_vectors.rerank(chunks, query_vector, top_k=top_k)
+    else:
+        if bm25 is None:
+            bm25 = BM25Index(chunks)
+        ranked = bm25.rerank(chunks, query, top_k=top_k)
+    return [dict(chunk, score=score) for chunk, score in ranked]
+
+def retrieve_context(query, top_k=15, collection=None, chunks=None, page_images=None, query_vector=None,
+                     section_index=None):
     """
     Retrieve relevant context based on the query and return a list of image paths
     
     Args:
         query: User query
         top_k: Number of chunks to retrieve
-        collection: ChromaDB collection for retrieval
-        chunks: List of document chunks
+        collection: VectorStore (or ChromaDB collection) for retrieval
+        chunks: ChunkStore or list of document chunks
+        page_images: Resident PageImageIndex of the content directory
+        query_vector: Precomputed embedding of query (encoded here if None)
+        section_index: Optional SectionIndex picking candidate pages before
+            chunks are scored
         
     Returns:
         List of paths to images found in the relevant pages
     """
-    if collection and chunks:
-        # Use ChromaDB for search with the original query
-        results = collection.query(
-            query_texts=[query],
-            n_results=top_k * 2  # Retrieve more results initially as we'll filter them later
-        )
+    if collection is not None and chunks:
+        if page_images is None:
+            raise ValueError("retrieve_context needs page_images (a PageImageIndex loaded once per content directory)")
+        chunk_store = as_chunk_store(chunks)
 
-        # Format results to match the original format
-        contexts = []
-        for i, doc_id in enumerate(results["ids"][0]):
-            # Find original chunk
-            for chunk in chunks:
-                if str(chunk["id"]) == doc_id:
-                    contexts.append({
-                        "text": chunk["text"],
-                        "section_title": chunk["section_title"],
-                        "start_page": chunk["start_page"],
-                        "score": float(results["distances"][0][i]) if "distances" in results else 0.0
-                    })
-                    break
+        # Dense (vector store) and BM25 search in parallel, fused with reciprocal rank fusion
+        retriever = HybridRetriever(chunk_store, as_vector_store(collection).query_batch,
+                                    section_index=section_index)
+        contexts = retriever.search(query, top_k=top_k, query_vector=query_vector)
 
         # Extract the start pages of the top chunks
-        top_pages = [ctx["start_page"] for ctx in contexts[:top_k]]
-
-        # Load extracted content JSON
-        extracted_content_path = os.path.join(content_dir, "extracted_content.json")
-        if not os.path.exists(extracted_content_path):
-            raise FileNotFoundError(f"File not found: {extracted_content_path}")
-
-        with open(extracted_content_path, "r", encoding="utf-8") as f:
-            extracted_content = json.load(f)
-
-        # Filter image paths that match the top pages
-        image_paths = [
-            image["path"] for chunk in extracted_content
-            if chunk.get("page_num") in top_pages and "images" in chunk
-            for image in chunk["images"]
-        ]
-        # Create a dictionary linking image paths with a tuple of page number and nearby text
-        image_contexts = {
-            image["path"]: (chunk.get("page_num"), image["nearby_text"])
-            for chunk in extracted_content
-            if chunk.get("page_num") in top_pages and "images" in chunk
-            for image in chunk["images"]
-        }
+        top_pages = [ctx["start_page"] for ctx in contexts]
+
+        # Image paths on the top pages, and a dictionary linking each path with (page number, nearby text)
+        image_paths, image_contexts = page_images.images_for_pages(top_pages)
 
         return image_paths, image_contexts  # Return the list of image paths
 
@@ -466,15 +413,20 @@ if __name__ == "__main__":
 
         print("\n")
 
-        # Pass the collection and chunks to the retrieve_context function
+        # Embed the description once: used for retrieval and for reranking
+        query_vector = encode_query(description["description"])
+
+        # Pass the collection, chunks and page image index to the retrieve_context function
         image_paths_list, image_contexts = retrieve_context(
             query=description["description"],
-            top_k=20,
-            collection=text_col,
-            chunks=chunks
+            top_k=10,
+            collection=processor.vector_store,
+            chunks=chunks,
+            page_images=PageImageIndex.load(content_dir),
+            query_vector=query_vector
         )
 
-        scores = rank_similar_images(cropped, top_k=3, image_paths_list=image_paths_list)
+        scores = rank_similar_images(cropped, top_k=3, image_paths_list=image_paths_list, bgr=True)
         print(f"Ranked similar images: {scores}")
 
         context_near = []
@@ -487,12 +439,11 @@ if __name__ == "__main__":
         top_pages = list(set([image_contexts[img[0]][0] for img in scores if img[0] in image_contexts]))
 
         # Collect all chunks from the top pages
-        all_chunks_from_pages = [
-            chunk for chunk in chunks if chunk["start_page"] in top_pages
-        ]
+        all_chunks_from_pages = chunks.chunks_for_pages(top_pages)
 
         # Re-rank the chunks based on the query
-        reranked_chunks = _rerank_chunks(all_chunks_from_pages, description["description"], top_k=3)
+        reranked_chunks = _rerank_chunks(all_chunks_from_pages, description["description"], top_k=3, bm25=chunks.bm25,
+                                         query_vector=query_vector, chunk_vectors=processor.chunk_vectors)
 
         print("\nRe-ranked chunks:")
         print(reranked_chunks)
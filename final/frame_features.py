@@ -0,0 +1,307 @@
+import os
+import json
+import argparse
+import numpy as np
+from image_index import file_sha1, top_k_indices
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+# Frames shown in the web viewer and where their patch features are stored
+DEFAULT_FRAMES_DIR = os.path.join(script_dir, "static", "cupra_frames")
+DEFAULT_FEATURES_DIR = os.path.join(script_dir, "frame_features")
+MANIFEST_FILENAME = "manifest.json"
+
+# Pooled patch tokens only replace crop encoding once they agree with it
+# (see check_parity); "on" and "off" force the choice
+FRAME_FEATURES_MODE = os.getenv("FRAME_FEATURES", "auto").lower()
+
+
+def box_cell_weights(box, image_size, grid_shape):
+    """
+    Fraction of each patch cell covered by a box
+
+    Args:
+        box: [x0, y0, x1, y1] in original image pixels
+        image_size: (width, height) of the original image
+        grid_shape: (grid_h, grid_w) of the patch grid
+
+    Returns:
+        float32 array of shape (grid_h, grid_w), all zeros if the box is empty
+    """
+    width, height = image_size
+    grid_h, grid_w = grid_shape
+    x0, y0, x1, y1 = [float(v) for v in box]
+    x0, x1 = max(0.0, min(x0, x1)), min(float(width), max(x0, x1))
+    y0, y1 = max(0.0, min(y0, y1)), min(float(height), max(y0, y1))
+
+    def axis_weights(lo, hi, length, cells):
+        edges = np.linspace(0.0, length, cells + 1, dtype=np.float32)
+        overlap = np.minimum(hi, edges[1:]) - np.maximum(lo, edges[:-1])
+        return np.clip(overlap, 0.0, None) / (length / cells)
+
+    return np.outer(axis_weights(y0, y1, height, grid_h), axis_weights(x0, x1, width, grid_w))
+
+
+class FramePatchFeatures:
+    """Persisted CLIP patch-token grids for the fixed cupra_frames"""
+
+    def __init__(self, features_dir, manifest, parity=None):
+        """
+        Args:
+            features_dir: Directory holding one .npy token grid per frame
+            manifest: Dict frame name -> {"file", "sha1", "size"}
+            parity: Result of the last check_parity run on these grids, if any
+        """
+        self.features_dir = features_dir
+        self.manifest = manifest
+        self.parity = parity
+        self._grids = {}
+
+    def __len__(self):
+        return len(self.manifest)
+
+    def __contains__(self, frame_name):
+        return os.path.basename(frame_name) in self.manifest
+
+    @classmethod
+    def load(cls, features_dir=DEFAULT_FEATURES_DIR):
+        """
+        Load the manifest of a previously built feature store
+
+        Token grids are memory-mapped on first use of each frame.
+
+        Returns:
+            FramePatchFeatures, or None if the features have not been built yet
+        """
+        manifest_path = os.path.join(features_dir, MANIFEST_FILENAME)
+        if not os.path.exists(manifest_path):
+            return None
+
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        return cls(features_dir, manifest["frames"], parity=manifest.get("parity"))
+
+    @classmethod
+    def load_for_serving(cls, features_dir=DEFAULT_FEATURES_DIR, mode=FRAME_FEATURES_MODE):
+        """
+        Features the server may use instead of encoding crops
+
+        Args:
+            mode: "auto" (only if the stored parity check passed), "on" or "off"
+
+        Returns:
+            FramePatchFeatures, or None when crops should be encoded
+        """
+        if mode == "off":
+            return None
+        features = cls.load(features_dir)
+        if features is None or mode == "on":
+            return features
+        if not (features.parity or {}).get("passed"):
+            print("Frame patch features not used: run 'python frame_features.py parity' "
+                  "(or set FRAME_FEATURES=on)")
+            return None
+        return features
+
+    def save_manifest(self):
+        """Write the manifest (frame entries and parity result) back to disk"""
+        manifest = {"frames": self.manifest}
+        if self.parity is not None:
+            manifest["parity"] = self.parity
+        with open(os.path.join(self.features_dir, MANIFEST_FILENAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+    @classmethod
+    def build(cls, frames_dir, features_dir, encode_fn, previous=None):
+        """
+        Encode every frame into a patch-token grid and write it to disk
+
+        Frames whose content hash is unchanged since the previous build are
+        skipped.
+
+        Args:
+            frames_dir: Directory with the frame images
+            features_dir: Output directory
+            encode_fn: Callable mapping an image path to a (grid_h, grid_w, dim) array
+            previous: Optional existing FramePatchFeatures to reuse grids from
+
+        Returns:
+            New FramePatchFeatures
+        """
+        from PIL import Image
+
+        os.makedirs(features_dir, exist_ok=True)
+        manifest = {}
+        for name in sorted(os.listdir(frames_dir)):
+            if not name.lower().endswith((".png", ".jpg", ".jpeg")):
+                continue
+            frame_path = os.path.join(frames_dir, name)
+            sha1 = file_sha1(frame_path)
+
+            if previous is not None and previous.manifest.get(name, {}).get("sha1") == sha1:
+                manifest[name] = previous.manifest[name]
+                continue
+
+            with Image.open(frame_path) as img:
+                size = list(img.size)
+            grid = encode_fn(frame_path)
+            grid_file = f"{os.path.splitext(name)[0]}.npy"
+            # float16 halves the footprint; pooling is done in float32
+            np.save(os.path.join(features_dir, grid_file), grid.astype(np.float16))
+            manifest[name] = {"file": grid_file, "sha1": sha1, "size": size}
+            print(f"Encoded {name}: grid {grid.shape[0]}x{grid.shape[1]}")
+
+        # A rebuild invalidates any earlier parity result
+        features = cls(features_dir, manifest)
+        features.save_manifest()
+        return features
+
+    def _grid(self, frame_name):
+        grid = self._grids.get(frame_name)
+        if grid is None:
+            entry = self.manifest[frame_name]
+            grid = np.load(os.path.join(self.features_dir, entry["file"]), mmap_mode="r")
+            self._grids[frame_name] = grid
+        return grid
+
+    def region_embedding(self, frame_name, box):
+        """
+        Embedding of a box on a frame, pooled from its stored patch tokens
+
+        Args:
+            frame_name: File name of the frame (e.g. "12.png")
+            box: [x0, y0, x1, y1] in original frame pixels
+
+        Returns:
+            L2-normalized float32 embedding, or None if the frame is not indexed
+            or the box does not overlap it
+        """
+        frame_name = os.path.basename(frame_name)
+        if frame_name not in self.manifest:
+            return None
+
+        grid = self._grid(frame_name)
+        weights = box_cell_weights(box, self.manifest[frame_name]["size"], grid.shape[:2])
+        total = weights.sum()
+        if total <= 0:
+            return None
+
+        # Media de los tokens ponderada por el área cubierta de cada celda
+        rows, cols = np.nonzero(weights)
+        cell_weights = weights[rows, cols] / total
+        region = cell_weights @ np.asarray(grid[rows, cols], dtype=np.float32)
+        norm = np.linalg.norm(region)
+        return region / norm if norm > 0 else None
+
+
+def check_parity(features, frames_dir, index, n_boxes=64, min_cosine=0.8, min_top3=0.67, seed=0):
+    """
+    Compare pooled region embeddings with encode_query_image on the crop
+
+    Random boxes are drawn on the frames. For each box, the region embedding
+    is compared with the embedding of the cropped pixels (cosine) and both
+    are used to rank the manual's images (top-3 overlap). The result is
+    stored in the manifest; the server only uses the features when it passed.
+
+    Args:
+        features: FramePatchFeatures to check
+        frames_dir: Directory with the frame images
+        index: ImageEmbeddingIndex of the manual images ranked in /image
+        n_boxes: Number of sample boxes
+        min_cosine: Minimum mean cosine region vs crop
+        min_top3: Minimum mean top-3 agreement
+
+    Returns:
+        Dict with boxes, mean_cosine, min_cosine, top3_agreement and passed
+    """
+    from PIL import Image
+    import similarity_img
+
+    rng = np.random.default_rng(seed)
+    frames = sorted(features.manifest)
+    cosines, overlaps = [], []
+    for i in range(n_boxes):
+        name = frames[i % len(frames)]
+        width, height = features.manifest[name]["size"]
+        box_w, box_h = rng.uniform(0.15, 0.6) * width, rng.uniform(0.15, 0.6) * height
+        x0, y0 = rng.uniform(0, width - box_w), rng.uniform(0, height - box_h)
+        box = [int(x0), int(y0), int(x0 + box_w), int(y0 + box_h)]
+
+        region = features.region_embedding(name, box)
+        if region is None:
+            continue
+        with Image.open(os.path.join(frames_dir, name)) as img:
+            crop = img.convert("RGB").crop(tuple(box))
+        reference = similarity_img.encode_query_image(crop)
+
+        cosines.append(float(region @ reference))
+        if index is not None and len(index):
+            expected = set(top_k_indices(index.embeddings @ reference, 3).tolist())
+            found = set(top_k_indices(index.embeddings @ region, 3).tolist())
+            overlaps.append(len(expected & found) / len(expected))
+
+    if not cosines:
+        raise ValueError("No sample box overlapped an indexed frame")
+    result = {
+        "boxes": len(cosines),
+        "mean_cosine": float(np.mean(cosines)),
+        "min_cosine": float(np.min(cosines)),
+        "top3_agreement": float(np.mean(overlaps)) if overlaps else None,
+    }
+    result["passed"] = bool(result["mean_cosine"] >= min_cosine
+                            and result["top3_agreement"] is not None and result["top3_agreement"] >= min_top3)
+
+    print(f"Boxes compared: {result['boxes']}")
+    print(f"Cosine region vs crop: min {result['min_cosine']:.4f}, mean {result['mean_cosine']:.4f}")
+    if result["top3_agreement"] is not None:
+        print(f"Top-3 agreement on manual images: {result['top3_agreement']:.1%}")
+    print("Parity OK" if result["passed"] else
+          f"Parity FAILED (mean cosine < {min_cosine} or top-3 agreement < {min_top3}); crops stay in use")
+    return result
+
+
+def main():
+    """Build or refresh the patch-token features of the viewer frames, or check them"""
+    parser = argparse.ArgumentParser(description="Precompute CLIP patch-token grids for the cupra_frames")
+    parser.add_argument("--frames_dir", default=DEFAULT_FRAMES_DIR, help="Directory with the frame images")
+    parser.add_argument("--features_dir", default=DEFAULT_FEATURES_DIR, help="Output directory")
+    parser.add_argument("--grid", type=int, default=21, help="Patches along the long side of each frame")
+    parser.add_argument("--rebuild", action="store_true", help="Re-encode every frame")
+    subparsers = parser.add_subparsers(dest="command")
+
+    parity_parser = subparsers.add_parser("parity", help="Compare region embeddings with crop embeddings")
+    parity_parser.add_argument("--content_dir", "-d",
+                               default=os.path.join(os.path.dirname(script_dir), "extracted_content_manual"),
+                               help="Manual whose CLIP image index is used for the top-3 check")
+    parity_parser.add_argument("--boxes", type=int, default=64, help="Number of sample boxes")
+    parity_parser.add_argument("--min_cosine", type=float, default=0.8, help="Minimum mean cosine")
+    parity_parser.add_argument("--min_top3", type=float, default=0.67, help="Minimum mean top-3 agreement")
+    args = parser.parse_args()
+
+    if args.command == "parity":
+        import similarity_img
+        from image_index import ImageEmbeddingIndex
+
+        features = FramePatchFeatures.load(args.features_dir)
+        if features is None:
+            raise SystemExit(f"No frame features in {args.features_dir}; run 'python frame_features.py' first")
+        features.parity = check_parity(features, args.frames_dir, ImageEmbeddingIndex.load(args.content_dir, model_name=similarity_img.model_name),
+                                       n_boxes=args.boxes, min_cosine=args.min_cosine, min_top3=args.min_top3)
+        features.save_manifest()
+        if not features.parity["passed"]:
+            raise SystemExit(1)
+        return
+
+    # Imported here so loading the features never pulls in the model
+    import similarity_img
+
+    def encode_fn(path):
+        return similarity_img.encode_patch_tokens(path, grid_long_side=args.grid)
+
+    previous = None if args.rebuild else FramePatchFeatures.load(args.features_dir)
+    features = FramePatchFeatures.build(args.frames_dir, args.features_dir, encode_fn, previous=previous)
+    print(f"Saved patch features for {len(features)} frames to {args.features_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from query_encoder import encode_queries
+from section_index import COARSE_SECTIONS
+
+# Dense searches run here while BM25 scores in the calling thread
+search_executor = ThreadPoolExecutor(max_workers=4)
+
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuse ranked lists with reciprocal rank fusion
+
+    Each item scores sum(1 / (k + rank)) over the lists it appears in, with
+    ranks starting at 1. Only ranks are used, so engines whose scores live on
+    different scales (cosine similarity, BM25) can be combined directly.
+
+    Args:
+        rankings: Dict engine name -> list of (id, engine score), best first
+        k: RRF damping constant
+
+    Returns:
+        List of (id, fused score, {engine: (rank, engine score)}), best first;
+        ties keep the order in which ids were first seen
+    """
+    fused = {}
+    for engine, ranking in rankings.items():
+        for rank, (doc_id, score) in enumerate(ranking, start=1):
+            entry = fused.setdefault(doc_id, [0.0, {}])
+            entry[0] += 1.0 / (k + rank)
+            entry[1][engine] = (rank, score)
+
+    ordered = sorted(fused.items(), key=lambda item: item[1][0], reverse=True)
+    return [(doc_id, fused_score, per_engine) for doc_id, (fused_score, per_engine) in ordered]
+
+
+def split_query_variants(query, expansion_text, max_variants=4):
+    """
+    Turn an LLM expansion answer into a list of distinct query variants
+
+    Args:
+        query: Original query, always the first variant
+        expansion_text: One reformulation per line; numbering and bullets
+            are stripped
+        max_variants: Maximum number of variants, original included
+
+    Returns:
+        List of query strings without duplicates (ignoring case)
+    """
+    variants = [query]
+    seen = {query.strip().lower()}
+    for line in expansion_text.splitlines():
+        variant = re.sub(r'^\s*(?:[-*\u2022]|\d+[.)])\s*', '', line).strip().strip('"')
+        if variant and variant.lower() not in seen:
+            seen.add(variant.lower())
+            variants.append(variant)
+        if len(variants) >= max_variants:
+            break
+    return variants
+
+
+class HybridRetriever:
+    """
+    Dense + BM25 chunk retrieval fused with reciprocal rank fusion
+
+    The dense query runs on a worker thread while BM25 scores in the calling
+    thread. With a section index, the query first picks candidate sections
+    and the dense engine only scores chunks on the pages those sections
+    cover; BM25 still scores every chunk, so lexical matches outside those
+    pages are not lost.
+    """
+
+    def __init__(self, chunk_store, dense_search, encode_fn=encode_queries, rrf_k=RRF_K,
+                 section_index=None, coarse_sections=COARSE_SECTIONS):
+        """
+        Args:
+            chunk_store: ChunkStore of the manual (provides text and the BM25 index)
+            dense_search: Function (query_vectors, n_results, where=None) -> one
+                [(id, similarity)] list per query, e.g. VectorStore.query_batch
+            encode_fn: Function list of texts -> matrix of query vectors, used
+                when the caller does not pass vectors
+            rrf_k: RRF damping constant
+            section_index: Optional SectionIndex used as the coarse tier
+            coarse_sections: Minimum number of sections the coarse tier keeps
+                (at least one per requested candidate); 0 disables the tier
+        """
+        self.chunk_store = chunk_store
+        self.dense_search = dense_search
+        self.encode_fn = encode_fn
+        self.rrf_k = rrf_k
+        if section_index is not None and coarse_sections and not section_index.coarsens(len(chunk_store)):
+            # A section tier about as large as the chunk index only adds a pass
+            print(f"Section tier disabled: {len(section_index)} sections for {len(chunk_store)} chunks")
+            section_index = None
+        self.section_index = section_index
+        self.coarse_sections = coarse_sections
+
+    def search(self, query, top_k=10, candidates=None, query_vector=None, where=None):
+        """
+        Retrieve chunks for a query
+
+        Args:
+            query: Search text
+            top_k: Number of fused results to return
+            candidates: Results requested from each engine (default top_k)
+            query_vector: Embedding of query, if the caller already computed
+                it (e.g. to rerank with the same vector afterwards)
+            where: Optional ChunkFilter restricting both engines to some
+                pages or sections
+
+        Returns:
+            List of context dicts {"id", "text", "section_title", "start_page",
+            "score"} best first, where score is the fused RRF score, plus
+            "dense_rank", "dense_score" (cosine similarity), "sparse_rank" and
+            "sparse_score" (BM25)
+            (None when the engine did not return the chunk)
+        """
+        query_vectors = None if query_vector is None else [query_vector]
+        return self.search_variants([query], top_k=top_k, candidates=candidates, query_vectors=query_vectors,
+                                    where=where)
+
+    def search_variants(self, queries, top_k=10, candidates=None, query_vectors=None, where=None):
+        """
+        Retrieve chunks for several phrasings of the same question
+
+        All variants are embedded in one encoder batch and sent to the dense
+        engine in one call; every (engine, variant) ranking is then fused with
+        RRF, so a chunk found by several variants rises to the top.
+
+        Args:
+            queries: Query variants
+            top_k: Number of fused results to return
+            candidates: Results requested from each engine per variant (default top_k)
+            query_vectors: Embeddings of the variants, if already computed
+            where: Optional ChunkFilter; the dense engine applies it inside the
+                vector query and BM25 as a mask, so only matching chunks are
+                scored. Without one, the section tier (if any) provides a
+                filter for the dense engine only.
+
+        Returns:
+            Context dicts as search() returns; the per-engine rank and score
+            are those of the variant that ranked the chunk best
+        """
+        candidates = candidates or top_k
+        if query_vectors is None:
+            query_vectors = self.encode_fn(queries)
+        mask = where.mask(self.chunk_store.columns) if where else None
+        if not where and self.section_index is not None and self.coarse_sections:
+            where = self.section_index.chunk_filter(query_vectors, top_k=max(self.coarse_sections, candidates))
+        if where:
+            dense_future = search_executor.submit(self.dense_search, query_vectors, candidates, where=where)
+        else:
+            dense_future = search_executor.submit(self.dense_search, query_vectors, candidates)
+        sparse = [self.chunk_store.bm25.search(query, top_k=candidates, mask=mask) for query in queries]
+        dense = dense_future.result()
+
+        rankings = {}
+        for i in range(len(queries)):
+            rankings[("dense", i)] = dense[i]
+            rankings[("sparse", i)] = sparse[i]
+
+        contexts = []
+        for doc_id, fused_score, per_ranking in reciprocal_rank_fusion(rankings, k=self.rrf_k):
+            chunk = self.chunk_store.get(doc_id)
+            if chunk is None:
+                continue
+
+            # Best rank per engine over the variants
+            best = {}
+            for (engine, _), (rank, engine_score) in per_ranking.items():
+                if engine not in best or rank < best[engine][0]:
+                    best[engine] = (rank, engine_score)
+            dense_rank, dense_score = best.get("dense", (None, None))
+            sparse_rank, sparse_score = best.get("sparse", (None, None))
+
+            contexts.append({
+                "id": str(doc_id),
+                "text": chunk["text"],
+                "section_title": chunk["section_title"],
+                "start_page": int(chunk["start_page"]),
+                "score": fused_score,
+                "dense_rank": dense_rank,
+                "dense_score": None if dense_score is None else float(dense_score),
+                "sparse_rank": sparse_rank,
+                "sparse_score": sparse_score,
+            })
+            if len(contexts) == top_k:
+                break
+        return contexts
@@ -0,0 +1,202 @@
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+from vector_search import top_k_indices  # re-exported for similarity_img and image_prefilter
+
+# Files written inside <content_dir>/clip_index
+INDEX_DIRNAME = "clip_index"
+EMBEDDINGS_FILENAME = "image_embeddings.npy"
+MANIFEST_FILENAME = "manifest.json"
+IMAGE_EXTENSIONS = (".jpeg", ".jpg", ".png")
+
+
+def file_sha1(path):
+    """Return the SHA-1 hex digest of a file's content"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def image_key(path):
+    """
+    Normalize an image path to the key used by the index.
+
+    Paths stored in extracted_content.json use Windows separators and are
+    relative to the repository root, while the server may pass absolute
+    paths. The file name is unique inside a manual's images folder, so it
+    is used as the key.
+    """
+    return os.path.basename(str(path).replace("\\", "/"))
+
+
+class ImageEmbeddingIndex:
+    """Precomputed, L2-normalized CLIP embeddings for the images of a manual"""
+
+    embeddings_filename = EMBEDDINGS_FILENAME
+    manifest_filename = MANIFEST_FILENAME
+
+    def __init__(self, embeddings, manifest):
+        """
+        Args:
+            embeddings: Float32 matrix of shape (n_images, dim), rows L2-normalized
+            manifest: List of dicts with "path" and "sha1", one per matrix row
+        """
+        self.embeddings = embeddings
+        self.manifest = manifest
+        self.row_by_key = {image_key(entry["path"]): i for i, entry in enumerate(manifest)}
+
+    def __len__(self):
+        return len(self.manifest)
+
+    def __contains__(self, path):
+        return image_key(path) in self.row_by_key
+
+    @staticmethod
+    def index_dir(content_dir):
+        return os.path.join(content_dir, INDEX_DIRNAME)
+
+    @classmethod
+    def load(cls, content_dir, model_name=None):
+        """
+        Load a previously built index
+
+        Args:
+            content_dir: Directory with extracted content
+            model_name: Model the caller encodes queries with; an index built
+                with another model is ignored (None skips the check)
+
+        Returns:
+            ImageEmbeddingIndex, or None if the index has not been built yet
+            or does not match model_name
+        """
+        index_dir = cls.index_dir(content_dir)
+        embeddings_path = os.path.join(index_dir, cls.embeddings_filename)
+        manifest_path = os.path.join(index_dir, cls.manifest_filename)
+
+        if not (os.path.exists(embeddings_path) and os.path.exists(manifest_path)):
+            return None
+
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        embeddings = np.load(embeddings_path).astype(np.float32, copy=False)
+
+        if embeddings.shape[0] != len(manifest["images"]):
+            print(f"Warning: {embeddings_path} does not match its manifest, ignoring it")
+            return None
+
+        if model_name is not None and manifest.get("model") != model_name:
+            print(f"Warning: {index_dir} was built with {manifest.get('model')}, not {model_name}; ignoring it")
+            return None
+
+        return cls(embeddings, manifest["images"])
+
+    @classmethod
+    def build(cls, content_dir, encode_fn, previous=None):
+        """
+        Encode every image of the manual
+
+        Images whose content hash is unchanged since the previous index are
+        not re-encoded.
+
+        Args:
+            content_dir: Directory with extracted content
+            encode_fn: Callable mapping a list of image paths to an
+                (n, dim) array of L2-normalized embeddings
+            previous: Optional existing index to reuse rows from
+
+        Returns:
+            New ImageEmbeddingIndex
+        """
+        images_dir = os.path.join(content_dir, "images")
+        filenames = sorted(
+            name for name in os.listdir(images_dir)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+
+        manifest = []
+        rows = [None] * len(filenames)
+        to_encode = []
+        for i, name in enumerate(filenames):
+            sha1 = file_sha1(os.path.join(images_dir, name))
+            manifest.append({"path": f"images/{name}", "sha1": sha1})
+
+            if previous is not None and name in previous.row_by_key:
+                prev_row = previous.row_by_key[name]
+                if previous.manifest[prev_row]["sha1"] == sha1:
+                    rows[i] = previous.embeddings[prev_row]
+                    continue
+            to_encode.append(i)
+
+        print(f"Encoding {len(to_encode)} of {len(filenames)} images")
+        if to_encode:
+            encoded = encode_fn([os.path.join(images_dir, filenames[i]) for i in to_encode])
+            for i, emb in zip(to_encode, encoded):
+                rows[i] = emb
+
+        embeddings = np.vstack(rows).astype(np.float32) if rows else np.zeros((0, 0), dtype=np.float32)
+        return cls(embeddings, manifest)
+
+    def save(self, content_dir, model_name=None):
+        """Write the embedding matrix and manifest to <content_dir>/clip_index"""
+        index_dir = self.index_dir(content_dir)
+        os.makedirs(index_dir, exist_ok=True)
+
+        np.save(os.path.join(index_dir, self.embeddings_filename), self.embeddings)
+        with open(os.path.join(index_dir, self.manifest_filename), "w", encoding="utf-8") as f:
+            json.dump({"model": model_name, "images": self.manifest}, f, indent=2)
+
+    def split_candidates(self, paths):
+        """
+        Separate candidate paths into indexed and not-yet-indexed ones
+
+        Returns:
+            Tuple (rows, indexed_paths, missing_paths)
+        """
+        rows, indexed, missing = [], [], []
+        for p in paths:
+            row = self.row_by_key.get(image_key(p))
+            if row is None:
+                missing.append(p)
+            else:
+                rows.append(row)
+                indexed.append(p)
+        return rows, indexed, missing
+
+    def score(self, query_emb, rows):
+        """Cosine similarity of a normalized query against the given rows"""
+        if not rows:
+            return np.zeros(0, dtype=np.float32)
+        return self.embeddings[rows] @ query_emb.astype(np.float32, copy=False)
+
+
+def main():
+    """Build or refresh the CLIP image index of a content directory"""
+    parser = argparse.ArgumentParser(description="Build the CLIP embedding index for extracted manual images")
+    parser.add_argument("--content_dir", "-d",
+                        default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                             "extracted_content_manual"),
+                        help="Directory containing the extracted content")
+    parser.add_argument("--rebuild", action="store_true", help="Re-encode every image, ignoring the existing index")
+    parser.add_argument("--batch_size", "-b", type=int, default=None, help="Images per CLIP forward pass")
+    parser.add_argument("--workers", "-w", type=int, default=None, help="Image decoding threads")
+    args = parser.parse_args()
+
+    # Imported here so loading the index never pulls in the model
+    import similarity_img
+
+    previous = None if args.rebuild else ImageEmbeddingIndex.load(args.content_dir, model_name=similarity_img.model_name)
+
+    def encode_fn(paths):
+        return similarity_img.encode_image_paths(paths, batch_size=args.batch_size, num_workers=args.workers)
+
+    index = ImageEmbeddingIndex.build(args.content_dir, encode_fn, previous=previous)
+    index.save(args.content_dir, model_name=similarity_img.model_name)
+    print(f"Saved CLIP index with {len(index)} images to {ImageEmbeddingIndex.index_dir(args.content_dir)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import os
+import argparse
+import numpy as np
+from PIL import Image
+from image_index import ImageEmbeddingIndex, top_k_indices
+
+THUMB_SIZE = 32
+LAYOUT_SIZE = 8
+COLOR_LEVELS = 4
+EDGE_BINS = 8
+
+
+def _unit(v):
+    norm = np.linalg.norm(v)
+    return v / norm if norm > 0 else v
+
+
+def load_thumbnail(path):
+    """Open an image at reduced resolution (JPEG draft mode skips most of the decode)"""
+    img = Image.open(path)
+    img.draft("RGB", (THUMB_SIZE * 2, THUMB_SIZE * 2))
+    return img.convert("RGB")
+
+
+def thumbnail_descriptor(img):
+    """
+    Cheap global descriptor of an RGB PIL image
+
+    Concatenates three unit-norm parts, so the dot product of two
+    descriptors is the mean of their cosines:
+    - a 4x4x4 RGB colour histogram (square-rooted, Hellinger style)
+    - a magnitude-weighted histogram of 8 gradient orientations
+    - an 8x8 zero-mean grayscale layout
+
+    Returns:
+        L2-normalized float32 vector
+    """
+    small = np.asarray(img.convert("RGB").resize((THUMB_SIZE, THUMB_SIZE), Image.BILINEAR), dtype=np.float32) / 255.0
+
+    levels = np.minimum((small * COLOR_LEVELS).astype(np.int64), COLOR_LEVELS - 1)
+    bins = (levels[..., 0] * COLOR_LEVELS + levels[..., 1]) * COLOR_LEVELS + levels[..., 2]
+    color = np.sqrt(np.bincount(bins.ravel(), minlength=COLOR_LEVELS ** 3).astype(np.float32))
+
+    gray = small @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    gx = np.diff(gray, axis=1)[:-1, :]
+    gy = np.diff(gray, axis=0)[:, :-1]
+    orientation = np.mod(np.arctan2(gy, gx), np.pi)
+    edge_bins = np.minimum((orientation / np.pi * EDGE_BINS).astype(np.int64), EDGE_BINS - 1)
+    edges = np.bincount(edge_bins.ravel(), weights=np.hypot(gx, gy).ravel(), minlength=EDGE_BINS)
+
+    block = THUMB_SIZE // LAYOUT_SIZE
+    layout = gray.reshape(LAYOUT_SIZE, block, LAYOUT_SIZE, block).mean(axis=(1, 3)).ravel()
+    layout = layout - layout.mean()
+
+    parts = [_unit(color), _unit(edges.astype(np.float32)), _unit(layout)]
+    return (np.concatenate(parts) / np.sqrt(len(parts))).astype(np.float32)
+
+
+def descriptors_for_paths(paths):
+    """Descriptor matrix for a list of image paths, one row per path"""
+    return np.array([thumbnail_descriptor(load_thumbnail(p)) for p in paths], dtype=np.float32)
+
+
+class ThumbnailDescriptorIndex(ImageEmbeddingIndex):
+    """Thumbnail descriptors of the manual images, stored next to the CLIP index"""
+
+    embeddings_filename = "thumb_descriptors.npy"
+    manifest_filename = "thumb_manifest.json"
+
+
+class StagedImageRanker:
+    """
+    Two-stage image ranker: thumbnail prefilter, then CLIP
+
+    Candidates already in the CLIP index are always scored exactly: that is
+    a row gather and one product, cheaper and better than any prefilter.
+    Only candidates that would have to be CLIP-encoded are prefiltered: the
+    shortlist_size of them whose thumbnail descriptor is closest to the
+    query are kept, the rest are dropped.
+    """
+
+    def __init__(self, descriptor_index=None, shortlist_size=32, image_index=None):
+        """
+        Args:
+            descriptor_index: ThumbnailDescriptorIndex; candidates missing from
+                it get their descriptor computed on the fly
+            shortlist_size: Unindexed candidates that survive the prefilter
+            image_index: CLIP ImageEmbeddingIndex of the same manual (defaults
+                to the default manual's index)
+        """
+        self.descriptor_index = descriptor_index
+        self.shortlist_size = shortlist_size
+        self.image_index = image_index
+
+    def _split_by_clip_index(self, candidate_paths):
+        import similarity_img
+
+        index = self.image_index if self.image_index is not None else similarity_img.image_index
+        if index is None:
+            return [], list(candidate_paths)
+        _, indexed, missing = index.split_candidates(candidate_paths)
+        return indexed, missing
+
+    def needs_query_image(self, candidate_paths):
+        """True if ranking these candidates runs the prefilter (which needs the query pixels)"""
+        _, missing = self._split_by_clip_index(list(dict.fromkeys(candidate_paths)))
+        return len(missing) > self.shortlist_size
+
+    def prefilter(self, query_image, candidate_paths, bgr=False):
+        """
+        Keep the CLIP-indexed candidates and the unindexed ones closest to the
+        query by thumbnail descriptor
+
+        Returns:
+            List of surviving candidate paths: indexed ones first, then the
+            prefiltered unindexed ones, best first
+        """
+        import similarity_img
+
+        indexed, candidates = self._split_by_clip_index(candidate_paths)
+        if len(candidates) <= self.shortlist_size:
+            return indexed + candidates
+
+        query_desc = thumbnail_descriptor(similarity_img.to_rgb_pil(query_image, bgr=bgr))
+
+        if self.descriptor_index is not None:
+            rows, paths, missing = self.descriptor_index.split_candidates(candidates)
+            scores = self.descriptor_index.score(query_desc, rows)
+        else:
+            paths, missing, scores = [], list(candidates), np.zeros(0, dtype=np.float32)
+
+        # Candidates not in the index: descriptor computed from a draft decode
+        missing_scores = []
+        for p in missing:
+            try:
+                missing_scores.append(float(thumbnail_descriptor(load_thumbnail(p)) @ query_desc))
+                paths.append(p)
+            except Exception as e:
+                print(f"Error processing {p}: {e}")
+        scores = np.concatenate([scores, np.array(missing_scores, dtype=np.float32)])
+
+        return indexed + [paths[i] for i in top_k_indices(scores, self.shortlist_size)]
+
+    def rank(self, query_image, candidate_paths, top_k=3, bgr=False, query_emb=None):
+        """
+        Rank candidate images against a query image
+
+        Args:
+            query_image: Query as a numpy array, PIL image or path
+            candidate_paths: Candidate image paths
+            top_k: Number of results to return
+            bgr: True if query_image is a numpy array in OpenCV's BGR order
+            query_emb: Optional precomputed CLIP embedding of the query
+
+        Returns:
+            Tuple (results, stats): (path, score) list as rank_similar_images
+            returns, and a dict with the number of candidates each stage
+            received and pruned
+        """
+        import similarity_img
+
+        # Unique candidates only: duplicates would be scored twice
+        candidate_paths = list(dict.fromkeys(candidate_paths))
+        survivors = self.prefilter(query_image, candidate_paths, bgr=bgr)
+
+        if query_emb is None:
+            query_emb = similarity_img.encode_query_image(query_image, bgr=bgr)
+        results = similarity_img.rank_by_embedding(query_emb, top_k=top_k, image_paths_list=survivors,
+                                                   index=self.image_index)
+
+        stats = {
+            "candidates": len(candidate_paths),
+            "prefilter_pruned": len(candidate_paths) - len(survivors),
+            "clip_scored": len(survivors),
+            "clip_pruned": max(0, len(survivors) - len(results)),
+        }
+        print(f"Staged ranking: {stats['candidates']} candidates, prefilter pruned {stats['prefilter_pruned']}, "
+              f"CLIP scored {stats['clip_scored']} and kept {len(results)}")
+        return results, stats
+
+
+def main():
+    """Compute thumbnail descriptors for every image of a content directory"""
+    parser = argparse.ArgumentParser(description="Build the thumbnail prefilter index for extracted manual images")
+    parser.add_argument("--content_dir", "-d",
+                        default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                             "extracted_content_manual"),
+                        help="Directory containing the extracted content")
+    parser.add_argument("--rebuild", action="store_true", help="Recompute every descriptor")
+    args = parser.parse_args()
+
+    previous = None if args.rebuild else ThumbnailDescriptorIndex.load(args.content_dir)
+    index = ThumbnailDescriptorIndex.build(args.content_dir, descriptors_for_paths, previous=previous)
+    index.save(args.content_dir, model_name="thumbnail-descriptor-v1")
+    print(f"Saved thumbnail descriptors for {len(index)} images")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from chatbot_text import get_response_json
+from content_index import PageImageIndexLoader, content_version, CONTENT_FILENAMES
+from image_index import ImageEmbeddingIndex
+from similarity_img import model_name as clip_model_name
+from image_prefilter import StagedImageRanker, ThumbnailDescriptorIndex
+from answer_cache import SemanticAnswerCache
+
+MANUAL_DIR_PREFIX = "extracted_content_"
+# Parsed JSON takes several times its file size as Python objects
+JSON_MEMORY_FACTOR = 4
+
+
+class ManualResources:
+    """
+    Everything needed to serve one manual
+
+    The chatbot owns the chunk store and vector store; the image path reuses
+    them together with the manual's page image index and CLIP indexes.
+    """
+
+    def __init__(self, manual_id, content_dir):
+        """
+        Args:
+            manual_id: Routing id of the manual (directory name without the
+                extracted_content_ prefix)
+            content_dir: Directory with the manual's extracted content
+        """
+        start_time = time.time()
+        self.manual_id = manual_id
+        self.content_dir = content_dir
+
+        # Chunks, BM25, vector store, stored chunk vectors and section tier come with the chatbot
+        self.chatbot = get_response_json(content_dir)
+        self.chunks = self.chatbot.chunk_store
+        self.vector_store = self.chatbot.vector_store
+        self.chunk_vectors = self.chatbot.chunk_vectors
+        self.section_index = self.chatbot.section_index
+
+        self.page_images = PageImageIndexLoader(content_dir)
+        self.page_images.get()
+
+        # An empty index (rather than None) keeps the default manual's index
+        # from being used for this manual's images
+        self.image_index = ImageEmbeddingIndex.load(content_dir, model_name=clip_model_name) or ImageEmbeddingIndex(
+            np.zeros((0, 0), dtype=np.float32), [])
+        self.image_ranker = StagedImageRanker(ThumbnailDescriptorIndex.load(content_dir),
+                                              image_index=self.image_index)
+
+        # Semantic cache of /chat answers, cleared when the manual's content files change
+        self.answer_cache = SemanticAnswerCache(
+            threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")),
+            max_size=int(os.getenv("ANSWER_CACHE_SIZE", "256")),
+            ttl_seconds=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+            version_fn=lambda: content_version(content_dir)
+        )
+
+        self.memory_bytes = self._estimate_memory()
+        self.load_seconds = time.time() - start_time
+
+    def _estimate_memory(self):
+        """
+        Rough resident size: index arrays plus parsed JSON
+
+        Model weights are shared by every manual through the model registry
+        and are not counted.
+        """
+        total = 0
+        arrays = [self.image_index.embeddings]
+        if self.chunk_vectors is not None:
+            arrays.append(self.chunk_vectors.embeddings)
+        if self.section_index is not None:
+            arrays.append(self.section_index.index.embeddings)
+        if self.image_ranker.descriptor_index is not None:
+            arrays.append(self.image_ranker.descriptor_index.embeddings)
+        for positions, weights in self.chunks.bm25.postings.values():
+            total += positions.nbytes + weights.nbytes
+        total += sum(array.nbytes for array in arrays)
+
+        for name in CONTENT_FILENAMES:
+            path = os.path.join(self.content_dir, name)
+            if os.path.exists(path):
+                total += JSON_MEMORY_FACTOR * os.path.getsize(path)
+        return total
+
+
+class ManualRegistry:
+    """
+    Manuals loaded on first request, least recently used evicted over budget
+
+    Manuals are the extracted_content_<id> directories under root_dir. A
+    manual is loaded the first time a request is routed to it; after each
+    load the least recently used manuals are dropped until the estimated
+    memory fits memory_budget_mb. The manual just loaded is never evicted,
+    and requests still holding an evicted manual keep working with it.
+    """
+
+    def __init__(self, root_dir, memory_budget_mb=2048, loader=ManualResources):
+        """
+        Args:
+            root_dir: Directory containing the extracted_content_* directories
+            memory_budget_mb: Memory budget for loaded manuals
+            loader: Function (manual_id, content_dir) -> resources with a
+                memory_bytes attribute
+        """
+        self.root_dir = root_dir
+        self.memory_budget_bytes = memory_budget_mb * 1024 * 1024
+        self.loader = loader
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def manual_dirs(self):
+        """Dict manual id -> content directory of every processed manual"""
+        manuals = {}
+        for name in sorted(os.listdir(self.root_dir)):
+            path = os.path.join(self.root_dir, name)
+            if (name.startswith(MANUAL_DIR_PREFIX) and os.path.isdir(path)
+                    and os.path.exists(os.path.join(path, "rag_chunks.json"))):
+                manuals[name[len(MANUAL_DIR_PREFIX):]] = path
+        return manuals
+
+    def content_dir(self, manual_id):
+        """Content directory of a manual; KeyError if it does not exist"""
+        content_dir = os.path.join(self.root_dir, MANUAL_DIR_PREFIX + manual_id)
+        if os.path.basename(content_dir) != MANUAL_DIR_PREFIX + manual_id or not os.path.exists(
+                os.path.join(content_dir, "rag_chunks.json")):
+            raise KeyError(f"Unknown manual '{manual_id}'")
+        return content_dir
+
+    def get(self, manual_id):
+        """Resources of a manual, loading it (and evicting others) if needed"""
+        with self._lock:
+            resources = self._loaded.get(manual_id)
+            if resources is not None:
+                self._loaded.move_to_end(manual_id)
+                return resources
+
+        # Unknown ids fail here, so they never get a load lock
+        content_dir = self.content_dir(manual_id)
+        with self._lock:
+            load_lock = self._load_locks.setdefault(manual_id, threading.Lock())
+
+        with load_lock:
+            # Another request may have loaded it while we waited
+            with self._lock:
+                resources = self._loaded.get(manual_id)
+                if resources is not None:
+                    self._loaded.move_to_end(manual_id)
+                    return resources
+
+            print(f"Loading manual '{manual_id}' from {content_dir}...")
+            resources = self.loader(manual_id, content_dir)
+
+            with self._lock:
+                self._loaded[manual_id] = resources
+                self.loads += 1
+                self._evict()
+            print(f"Loaded manual '{manual_id}' ({resources.memory_bytes / 1e6:.1f} MB). {self.report()}")
+            return resources
+
+    def _evict(self):
+        # Called with self._lock held; the last entry is the one just loaded
+        while len(self._loaded) > 1 and self.memory_bytes() > self.memory_budget_bytes:
+            manual_id, _ = self._loaded.popitem(last=False)
+            self.evictions += 1
+            print(f"Evicted manual '{manual_id}' to stay under the memory budget")
+
+    def memory_bytes(self):
+        return sum(resources.memory_bytes for resources in self._loaded.values())
+
+    def loaded(self):
+        """Loaded manual ids, least recently used first"""
+        with self._lock:
+            return list(self._loaded.keys())
+
+    def report(self):
+        with self._lock:
+            return (f"Manuals loaded: {len(self._loaded)} ({self.memory_bytes() / 1e6:.1f} MB of "
+                    f"{self.memory_budget_bytes / 1e6:.0f} MB), {self.loads} loads, {self.evictions} evictions")
@@ -0,0 +1,291 @@
+import os
+import time
+import argparse
+import numpy as np
+from onnx_utils import make_session, quantize_int8
+from bench_utils import peak_rss_mb, sample_title_queries
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+DEFAULT_ONNX_DIR = os.path.join(script_dir, "onnx_models")
+DEFAULT_ONNX_PATH = os.path.join(DEFAULT_ONNX_DIR, "minilm_int8.onnx")
+# max_seq_length of all-MiniLM-L6-v2; longer texts are truncated like SentenceTransformer does
+MAX_SEQ_LENGTH = 256
+
+
+def tokenizer_dir(model_path):
+    """Directory where export_text_encoder saves the tokenizer of a model"""
+    return os.path.splitext(model_path)[0] + "_tokenizer"
+
+
+class OnnxSentenceEncoder:
+    """
+    all-MiniLM-L6-v2 (transformer + mean pooling + normalization) on ONNX Runtime
+
+    encode() takes the same arguments as SentenceTransformer.encode, so the
+    encoder can stand in for the PyTorch model in the query encoder and the
+    Chroma embedding function.
+    """
+
+    def __init__(self, model_path=DEFAULT_ONNX_PATH, max_length=MAX_SEQ_LENGTH, num_threads=None):
+        """
+        Args:
+            model_path: Exported .onnx file (see export_text_encoder); the
+                tokenizer is read from tokenizer_dir(model_path)
+            max_length: Maximum number of tokens per text
+            num_threads: Intra-op threads, defaults to ONNX Runtime's choice
+        """
+        from tokenizers import Tokenizer
+
+        tokenizer_path = os.path.join(tokenizer_dir(model_path), "tokenizer.json")
+        if not os.path.exists(model_path) or not os.path.exists(tokenizer_path):
+            raise FileNotFoundError(
+                f"ONNX text encoder not found at {model_path}. "
+                "Run 'python minilm_onnx.py export' first."
+            )
+
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        pad_id = self.tokenizer.token_to_id("[PAD]") or 0
+        self.tokenizer.enable_padding(pad_id=pad_id, pad_token="[PAD]")
+
+        self.model_path = model_path
+        self.session = make_session(model_path, num_threads=num_threads)
+        # The optimizer may drop inputs the graph does not use (e.g. token_type_ids)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.embedding_dim = self.session.get_outputs()[0].shape[-1]
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        feed = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        feed = {name: value for name, value in feed.items() if name in self.input_names}
+        return self.session.run(None, feed)[0]
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, convert_to_numpy=True,
+               normalize_embeddings=False, **kwargs):
+        """
+        Args:
+            sentences: Text or list of texts
+            batch_size: Texts per forward pass
+
+        Returns:
+            L2-normalized float32 embeddings of shape (n, dim), or (dim,) for a
+            single text. The remaining SentenceTransformer arguments are
+            accepted and ignored: the graph already normalizes its output.
+        """
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, self.embedding_dim), dtype=np.float32)
+
+        # Longest texts first, so each batch is padded to similar lengths
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        embeddings = np.empty((len(texts), self.embedding_dim), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            embeddings[rows] = self._encode_batch([texts[i] for i in rows])
+        return embeddings[0] if single else embeddings
+
+
+def export_text_encoder(output_path=DEFAULT_ONNX_PATH, model_name=DEFAULT_MODEL_NAME, quantize=True):
+    """
+    Export all-MiniLM-L6-v2 to ONNX and optionally quantize it to int8
+
+    The exported graph includes the mean pooling and the L2 normalization, so
+    its output is directly comparable with SentenceTransformer embeddings.
+    The tokenizer is saved next to the model.
+
+    Args:
+        output_path: Destination .onnx file
+        model_name: SentenceTransformer checkpoint
+        quantize: Apply dynamic int8 weight quantization
+
+    Returns:
+        Path of the written model
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    class SentenceTower(torch.nn.Module):
+        def __init__(self, transformer):
+            super().__init__()
+            self.transformer = transformer
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            tokens = self.transformer(input_ids=input_ids, attention_mask=attention_mask,
+                                      token_type_ids=token_type_ids).last_hidden_state
+            mask = attention_mask.unsqueeze(-1).to(tokens.dtype)
+            pooled = (tokens * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            return pooled / pooled.norm(p=2, dim=-1, keepdim=True).clamp(min=1e-12)
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    sentence_model = SentenceTransformer(model_name, device="cpu").eval()
+    tokenizer = sentence_model.tokenizer
+    tokenizer.save_pretrained(tokenizer_dir(output_path))
+    fp32_path = output_path.replace(".onnx", "_fp32.onnx") if quantize else output_path
+
+    dummy = tokenizer(["How do I open the charging flap?"], return_tensors="pt")
+    torch.onnx.export(
+        SentenceTower(sentence_model[0].auto_model),
+        (dummy["input_ids"], dummy["attention_mask"], dummy["token_type_ids"]),
+        fp32_path,
+        input_names=["input_ids", "attention_mask", "token_type_ids"],
+        output_names=["sentence_embedding"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "token_type_ids": {0: "batch", 1: "sequence"},
+            "sentence_embedding": {0: "batch"},
+        },
+        opset_version=17,
+    )
+    print(f"Exported FP32 text encoder to {fp32_path}")
+
+    if quantize:
+        quantize_int8(fp32_path, output_path)
+        print(f"Quantized int8 text encoder written to {output_path}")
+
+    return output_path
+
+
+def _stored_vectors(content_dir, model_name):
+    """Chunk vectors already stored for a manual: the NumPy index if built, else ChromaDB"""
+    from vector_search import NumpyVectorIndex
+    from vector_store import open_chroma_collection
+
+    index = NumpyVectorIndex.load(content_dir)
+    if index is not None and index.meta.get("model") == model_name:
+        return index
+    return NumpyVectorIndex.from_collection(open_chroma_collection(content_dir, model_name))
+
+
+def check_parity(onnx_path, content_dir, model_name=DEFAULT_MODEL_NAME, n_queries=100, top_k=10,
+                 min_cosine=0.98):
+    """
+    Compare ONNX embeddings against the chunk vectors stored for the manual
+
+    Every chunk text is re-encoded with the ONNX model and compared with its
+    stored vector (cosine, and whether the stored vector of the same chunk
+    is its nearest neighbour). Section titles are then used as queries to
+    compare the top_k chunks found with ONNX and with PyTorch query vectors.
+
+    Returns:
+        True if every chunk cosine is at least min_cosine
+    """
+    from chunk_store import ChunkStore
+    from vector_search import normalize_rows, top_k_indices
+    from model_registry import get_sentence_model
+
+    chunks = ChunkStore.load(content_dir)
+    if chunks is None:
+        raise FileNotFoundError(f"Chunks file not found in {content_dir}")
+    stored = _stored_vectors(content_dir, model_name)
+    ids = [doc_id for doc_id in stored.ids if chunks.get(doc_id) is not None]
+    reference = normalize_rows(np.asarray(stored.embeddings, dtype=np.float32)[[stored.row_by_id[i] for i in ids]])
+
+    encoder = OnnxSentenceEncoder(onnx_path)
+    candidate = encoder.encode([chunks.get(doc_id)["text"] for doc_id in ids], batch_size=64)
+
+    cosines = np.sum(reference * candidate, axis=1)
+    self_match = np.mean(np.argmax(candidate @ reference.T, axis=1) == np.arange(len(ids)))
+
+    queries = sample_title_queries(chunks, n_queries)
+    torch_queries = normalize_rows(get_sentence_model(model_name).encode(queries, convert_to_numpy=True))
+    onnx_queries = encoder.encode(queries)
+    overlaps = []
+    for torch_query, onnx_query in zip(torch_queries, onnx_queries):
+        expected = set(top_k_indices(reference @ torch_query, top_k).tolist())
+        found = set(top_k_indices(reference @ onnx_query, top_k).tolist())
+        overlaps.append(len(expected & found) / max(len(expected), 1))
+
+    print(f"Chunks compared: {len(ids)}")
+    print(f"Cosine stored vs onnx: min {cosines.min():.4f}, mean {cosines.mean():.4f}")
+    print(f"Chunks whose nearest stored vector is their own: {self_match:.1%}")
+    print(f"Query top-{top_k} agreement torch vs onnx ({len(queries)} queries): {np.mean(overlaps):.1%}")
+
+    passed = bool(cosines.min() >= min_cosine)
+    print("Parity OK" if passed else f"Parity FAILED (min cosine < {min_cosine})")
+    return passed
+
+
+def benchmark(backend, content_dir, onnx_path=DEFAULT_ONNX_PATH, batch_sizes=(1, 8, 32), repeats=20,
+              model_name=DEFAULT_MODEL_NAME, num_threads=None):
+    """
+    Measure query-encoding latency and peak RSS of one backend
+
+    Queries are section titles of random chunks; the query embedding cache is
+    bypassed. Run once per backend in separate processes so RSS figures are
+    comparable.
+    """
+    from chunk_store import ChunkStore
+
+    chunks = ChunkStore.load(content_dir)
+    if chunks is None:
+        raise FileNotFoundError(f"Chunks file not found in {content_dir}")
+    max_batch = max(batch_sizes)
+    queries = sample_title_queries(chunks, max_batch)
+    queries = (queries * (max_batch // max(len(queries), 1) + 1))[:max_batch]
+
+    if backend == "onnx":
+        encoder = OnnxSentenceEncoder(onnx_path, num_threads=num_threads)
+    else:
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        encoder = SentenceTransformer(model_name, device="cpu")
+
+    print(f"Backend: {backend}")
+    for batch_size in batch_sizes:
+        batch = queries[:batch_size]
+        encoder.encode(batch, convert_to_numpy=True)  # warm-up
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            encoder.encode(batch, convert_to_numpy=True)
+            timings.append(time.perf_counter() - start)
+        median = float(np.median(timings))
+        print(f"  batch {batch_size:>3}: {median * 1000:8.2f} ms/batch "
+              f"(p95 {np.percentile(timings, 95) * 1000:.2f}), {batch_size / median:8.1f} queries/s")
+    print(f"  peak RSS: {peak_rss_mb():.0f} MB")
+
+
+def main():
+    default_content_dir = os.path.join(os.path.dirname(script_dir), "extracted_content_manual")
+    parser = argparse.ArgumentParser(description="ONNX Runtime backend for the all-MiniLM-L6-v2 text encoder")
+    parser.add_argument("--onnx_path", default=DEFAULT_ONNX_PATH, help="Path of the ONNX model")
+    parser.add_argument("--content_dir", "-d", default=default_content_dir, help="Directory with extracted content")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Export (and quantize) the text encoder")
+    export_parser.add_argument("--no-quantize", action="store_true", help="Keep FP32 weights")
+
+    parity_parser = subparsers.add_parser("parity", help="Compare ONNX embeddings with the stored chunk vectors")
+    parity_parser.add_argument("--n_queries", type=int, default=100, help="Section-title queries to compare")
+    parity_parser.add_argument("--min_cosine", type=float, default=0.98, help="Minimum accepted cosine")
+
+    bench_parser = subparsers.add_parser("benchmark", help="Measure latency and RSS of a backend")
+    bench_parser.add_argument("--backend", choices=["torch", "onnx"], default="onnx")
+    bench_parser.add_argument("--repeats", type=int, default=20, help="Timed runs per batch size")
+    bench_parser.add_argument("--threads", type=int, default=None, help="Intra-op threads")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_text_encoder(args.onnx_path, quantize=not args.no_quantize)
+    elif args.command == "parity":
+        if not check_parity(args.onnx_path, args.content_dir, n_queries=args.n_queries,
+                            min_cosine=args.min_cosine):
+            raise SystemExit(1)
+    else:
+        benchmark(args.backend, args.content_dir, onnx_path=args.onnx_path, repeats=args.repeats,
+                  num_threads=args.threads)
+
+
+if __name__ == "__main__":
+    main()
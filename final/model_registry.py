@@ -0,0 +1,214 @@
+import os
+import time
+import threading
+from chromadb.utils import embedding_functions
+from minilm_onnx import DEFAULT_MODEL_NAME as ONNX_TEXT_MODEL, DEFAULT_ONNX_PATH as DEFAULT_TEXT_ONNX_PATH
+
+# Backend of the sentence encoder: "torch" (default) or "onnx" (int8 ONNX Runtime, CPU)
+text_encoder_backend = os.getenv("TEXT_ENCODER_BACKEND", "torch").lower()
+text_onnx_path = os.getenv("TEXT_ONNX_PATH", DEFAULT_TEXT_ONNX_PATH)
+text_onnx_threads = int(os.getenv("TEXT_ONNX_THREADS", "0")) or None
+
+
+def _rss_bytes():
+    """Current resident set size of the process (Linux), or None if unavailable"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _tensor_bytes(model):
+    """Bytes held by a torch module's parameters and buffers, or None for other objects"""
+    if not hasattr(model, "parameters") or not hasattr(model, "buffers"):
+        return None
+    tensors = list(model.parameters()) + list(model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded models
+
+    Each model is loaded at most once, on the first get() for its key, and
+    then shared by every module. Loads of different models can run in
+    parallel; concurrent requests for the same model wait for one load.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._stats = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        """
+        Return the model stored under key, loading it with loader() if needed
+
+        Args:
+            key: Unique name of the model (e.g. "sentence-transformer:all-MiniLM-L6-v2")
+            loader: Zero-argument callable that loads the model
+
+        Returns:
+            The shared model instance
+        """
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            model = self._models.get(key)
+            if model is not None:
+                return model
+
+            rss_before = _rss_bytes()
+            start = time.perf_counter()
+            model = loader()
+            load_seconds = time.perf_counter() - start
+            rss_after = _rss_bytes()
+
+            footprint = _tensor_bytes(model)
+            if footprint is None and rss_before is not None and rss_after is not None:
+                footprint = max(0, rss_after - rss_before)
+
+            self._stats[key] = {
+                "name": key,
+                "load_seconds": load_seconds,
+                "memory_mb": footprint / (1024 * 1024) if footprint is not None else None,
+            }
+            self._models[key] = model
+            print(f"Loaded model {key} in {load_seconds:.2f}s")
+            return model
+
+    def is_loaded(self, key):
+        return key in self._models
+
+    def stats(self):
+        """List of {"name", "load_seconds", "memory_mb"} for every loaded model"""
+        return [dict(s) for s in self._stats.values()]
+
+    def report(self):
+        """Human-readable summary of loaded models"""
+        if not self._stats:
+            return "No models loaded"
+        lines = []
+        for s in self._stats.values():
+            memory = f"{s['memory_mb']:.0f} MB" if s["memory_mb"] is not None else "unknown"
+            lines.append(f"  - {s['name']}: {memory}, loaded in {s['load_seconds']:.2f}s")
+        return "Loaded models:\n" + "\n".join(lines)
+
+
+registry = ModelRegistry()
+
+
+def get_sentence_model(model_name="all-MiniLM-L6-v2"):
+    """Shared SentenceTransformer text encoder"""
+    def load():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_name)
+
+    return registry.get(f"sentence-transformer:{model_name}", load)
+
+
+def get_clip_model(model_name="openai/clip-vit-base-patch32", device="cpu"):
+    """Shared PyTorch CLIP model in eval mode"""
+    def load():
+        from transformers import CLIPModel
+        return CLIPModel.from_pretrained(model_name).to(device).eval()
+
+    return registry.get(f"clip:{model_name}:{device}", load)
+
+
+def get_clip_processor(model_name="openai/clip-vit-base-patch32"):
+    """Shared CLIP preprocessing (tokenizer and image processor)"""
+    def load():
+        from transformers import CLIPProcessor
+        return CLIPProcessor.from_pretrained(model_name)
+
+    return registry.get(f"clip-processor:{model_name}", load)
+
+
+def get_onnx_clip_image_encoder(model_path, num_threads=None):
+    """Shared ONNX Runtime CLIP image encoder"""
+    def load():
+        from clip_onnx import OnnxClipImageEncoder
+        return OnnxClipImageEncoder(model_path, num_threads=num_threads)
+
+    return registry.get(f"clip-onnx:{model_path}", load)
+
+
+def get_onnx_clip_text_encoder(model_path, num_threads=None):
+    """Shared ONNX Runtime CLIP text encoder"""
+    def load():
+        from clip_onnx import OnnxClipTextEncoder
+        return OnnxClipTextEncoder(model_path, num_threads=num_threads)
+
+    return registry.get(f"clip-text-onnx:{model_path}", load)
+
+
+def get_onnx_sentence_encoder(model_path, num_threads=None):
+    """Shared ONNX Runtime all-MiniLM-L6-v2 encoder"""
+    def load():
+        from minilm_onnx import OnnxSentenceEncoder
+        return OnnxSentenceEncoder(model_path, num_threads=num_threads)
+
+    return registry.get(f"minilm-onnx:{model_path}", load)
+
+
+def text_backend(model_name="all-MiniLM-L6-v2"):
+    """
+    Backend that encodes texts for model_name: "onnx" or "torch"
+
+    Only the exported all-MiniLM-L6-v2 runs on ONNX; other models always use
+    SentenceTransformer.
+    """
+    if text_encoder_backend == "onnx" and model_name == ONNX_TEXT_MODEL:
+        return "onnx"
+    return "torch"
+
+
+def get_text_encoder(model_name="all-MiniLM-L6-v2"):
+    """
+    Shared sentence encoder of the configured backend (TEXT_ENCODER_BACKEND)
+
+    Both backends offer SentenceTransformer's encode(texts, convert_to_numpy=True).
+    """
+    if text_backend(model_name) == "onnx":
+        return get_onnx_sentence_encoder(text_onnx_path, num_threads=text_onnx_threads)
+    return get_sentence_model(model_name)
+
+
+class SharedSentenceTransformerEmbeddingFunction(embedding_functions.SentenceTransformerEmbeddingFunction):
+    """
+    Chroma embedding function backed by the registry's sentence encoder
+
+    Chroma's own class loads a private copy of the model in its constructor.
+    This subclass skips that and embeds with the shared encoder (PyTorch or
+    ONNX, see get_text_encoder) in its own __call__, while keeping the name
+    and configuration Chroma stored with the collection.
+    """
+
+    def __init__(self, model_name="all-MiniLM-L6-v2", device="cpu", normalize_embeddings=False):
+        # The parent constructor is skipped on purpose: it would load the model
+        self.model_name = model_name
+        self.device = device
+        self.normalize_embeddings = normalize_embeddings
+        self.kwargs = {}
+
+    def __call__(self, input):
+        """Embed documents with the shared encoder; Chroma expects one list of floats per document"""
+        embeddings = get_text_encoder(self.model_name).encode(
+            list(input),
+            convert_to_numpy=True,
+            normalize_embeddings=self.normalize_embeddings
+        )
+        return [embedding.tolist() for embedding in embeddings]
+
+
+def get_embedding_function(model_name="all-MiniLM-L6-v2"):
+    """Chroma embedding function that shares the registry's text encoder"""
+    return SharedSentenceTransformerEmbeddingFunction(model_name=model_name)
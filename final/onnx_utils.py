@@ -0,0 +1,23 @@
+def make_session(model_path, num_threads=None):
+    """
+    CPU ONNX Runtime session with full graph optimization
+
+    Args:
+        model_path: .onnx file
+        num_threads: Intra-op threads, defaults to ONNX Runtime's choice
+    """
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if num_threads:
+        options.intra_op_num_threads = num_threads
+    return ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def quantize_int8(fp32_path, out_path):
+    """Dynamic int8 quantization of the weights of an exported FP32 model"""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    quantize_dynamic(fp32_path, out_path, weight_type=QuantType.QInt8)
+    return out_path
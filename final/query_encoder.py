@@ -0,0 +1,125 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from model_registry import get_text_encoder, text_backend
+
+DEFAULT_TEXT_MODEL = "all-MiniLM-L6-v2"
+
+
+def normalize_query_text(text):
+    """
+    Cache key form of a query: lower case, whitespace collapsed
+
+    all-MiniLM-L6-v2 uses an uncased tokenizer that also ignores runs of
+    whitespace, so texts with the same key get the same embedding.
+    """
+    return " ".join(text.lower().split())
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of query vectors, keyed on (model, backend, normalized text)
+
+    Cached vectors are read-only arrays, so they can be handed to several
+    request threads at once.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Cached vector for key (marked as recently used), or None"""
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key, vector):
+        """Store a vector, evicting the least recently used entries beyond max_size"""
+        vector = np.array(vector, dtype=np.float32)
+        vector.setflags(write=False)
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return vector
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Dict with hits, misses, hit_rate, size and max_size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
+
+    def report(self):
+        s = self.stats()
+        return (f"Query embedding cache: {s['hits']} hits / {s['misses']} misses "
+                f"({s['hit_rate']:.0%}), {s['size']}/{s['max_size']} entries")
+
+
+# One cache per process, shared by every retriever
+query_cache = QueryEmbeddingCache(max_size=int(os.getenv("QUERY_CACHE_SIZE", "1024")))
+
+
+def encode_queries(texts, model_name=DEFAULT_TEXT_MODEL):
+    """
+    Embed query texts with the shared sentence encoder
+
+    The encoder is SentenceTransformer, or the int8 ONNX model when
+    TEXT_ENCODER_BACKEND=onnx. Texts already in query_cache are not
+    re-encoded; the misses go to the model in one batch. Vectors are not
+    normalized, matching what the Chroma embedding function stored for the
+    chunks, so they can be passed as query_embeddings.
+
+    Returns:
+        (len(texts), dim) float32 matrix
+    """
+    texts = list(texts)
+    backend = text_backend(model_name)
+    keys = [(model_name, backend, normalize_query_text(text)) for text in texts]
+    vectors = [query_cache.get(key) for key in keys]
+
+    missing = {}
+    for i, vector in enumerate(vectors):
+        if vector is None:
+            missing.setdefault(keys[i], []).append(i)
+    if missing:
+        miss_texts = [texts[positions[0]] for positions in missing.values()]
+        encoded = get_text_encoder(model_name).encode(miss_texts, convert_to_numpy=True)
+        for (key, positions), vector in zip(missing.items(), encoded):
+            vector = query_cache.put(key, vector)
+            for i in positions:
+                vectors[i] = vector
+
+    if not vectors:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.stack(vectors).astype(np.float32, copy=False)
+
+
+def encode_query(text, model_name=DEFAULT_TEXT_MODEL):
+    """Embed a single query text (see encode_queries)"""
+    return encode_queries([text], model_name=model_name)[0]
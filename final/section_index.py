@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from chunk_store import ChunkStore, ChunkFilter, end_pages
+from content_index import content_version
+from vector_search import NumpyVectorIndex
+from model_registry import get_text_encoder
+
+DEFAULT_TEXT_MODEL = "all-MiniLM-L6-v2"
+SECTIONS_FILENAME = "identified_sections.json"
+SECTION_INDEX_DIRNAME = "section_index"
+
+# Sections picked by the coarse tier before chunks are scored; off (0) unless
+# 'section_index.py benchmark' shows the recall holds for the manual
+COARSE_SECTIONS = int(os.getenv("COARSE_SECTIONS", "0"))
+# The tier is skipped when it has more than this many sections per chunk
+MAX_SECTIONS_PER_CHUNK = 0.5
+
+
+def load_sections(content_dir):
+    """Sections written by pre.identify_sections, or None if the file is missing"""
+    sections_path = os.path.join(content_dir, SECTIONS_FILENAME)
+    if not os.path.exists(sections_path):
+        return None
+    with open(sections_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def section_text(section):
+    """Text embedded for a section (its content already starts with the title)"""
+    return section.get("content") or section.get("title") or ""
+
+
+class SectionIndex:
+    """
+    Coarse retrieval tier: one vector per section of identified_sections.json
+
+    The query is scored against the sections first; the pages those
+    sections cover become a ChunkFilter, so dense search only scores chunks
+    on candidate pages. The coarse step costs one product over the
+    sections, independent of how many chunks each section was split into.
+    """
+
+    def __init__(self, index, sections):
+        """
+        Args:
+            index: NumpyVectorIndex of section vectors, ids are section ids
+            sections: Section dicts in file (page) order
+        """
+        self.index = index
+        self.sections = sections
+        start_pages = [int(section["start_page"]) for section in sections]
+        self.pages_by_id = {
+            str(section["id"]): (start, end)
+            for section, start, end in zip(sections, start_pages, end_pages(start_pages))
+        }
+
+    def __len__(self):
+        return len(self.index)
+
+    def coarsens(self, n_chunks):
+        """True if scoring the sections is much cheaper than scoring n_chunks chunks"""
+        return len(self) < MAX_SECTIONS_PER_CHUNK * n_chunks
+
+    @classmethod
+    def load_or_build(cls, content_dir, model_name=DEFAULT_TEXT_MODEL):
+        """
+        Section index of a manual, encoding the sections if the saved one is stale
+
+        Returns:
+            SectionIndex, or None if the manual has no identified_sections.json
+        """
+        sections = load_sections(content_dir)
+        if not sections:
+            return None
+
+        version = content_version(content_dir, (SECTIONS_FILENAME,))
+        index = NumpyVectorIndex.load(content_dir, dirname=SECTION_INDEX_DIRNAME)
+        if (index is None or index.meta.get("model") != model_name
+                or index.meta.get("content_version") != version or len(index) != len(sections)):
+            print(f"Building section index for {len(sections)} sections...")
+            vectors = get_text_encoder(model_name).encode(
+                [section_text(section) for section in sections],
+                batch_size=64,
+                show_progress_bar=True,
+                convert_to_numpy=True
+            )
+            index = NumpyVectorIndex.build([str(section["id"]) for section in sections], vectors,
+                                           meta={"model": model_name, "content_version": version})
+            index.save(content_dir, dirname=SECTION_INDEX_DIRNAME)
+            index = NumpyVectorIndex.load(content_dir, dirname=SECTION_INDEX_DIRNAME)
+        return cls(index, sections)
+
+    def top_sections(self, query_vectors, top_k=10):
+        """
+        Best sections over several query variants
+
+        Returns:
+            List of (section id, best cosine similarity over the variants), best first
+        """
+        best = {}
+        for hits in self.index.search_batch(query_vectors, top_k=top_k):
+            for section_id, score in hits:
+                if score > best.get(section_id, -np.inf):
+                    best[section_id] = score
+        return sorted(best.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+    def candidate_pages(self, query_vectors, top_k=10):
+        """Sorted pages covered by the top_k sections"""
+        pages = set()
+        for section_id, _ in self.top_sections(query_vectors, top_k=top_k):
+            first, last = self.pages_by_id[section_id]
+            pages.update(range(first, last + 1))
+        return sorted(pages)
+
+    def chunk_filter(self, query_vectors, top_k=10):
+        """ChunkFilter restricting chunk search to the pages of the top_k sections"""
+        return ChunkFilter(pages=self.candidate_pages(query_vectors, top_k=top_k))
+
+
+def benchmark(content_dir, n_queries=100, top_k=10, coarse_sections=(5, 10, 20, 40), model_name=DEFAULT_TEXT_MODEL):
+    """
+    Compare two-stage (sections, then chunks on their pages) with flat chunk search
+
+    Queries are section titles of randomly picked chunks. Reports the chunks
+    scored per query, latency and dense recall@top_k against exact search
+    over all chunk vectors. Run it before setting COARSE_SECTIONS.
+    """
+    from bench_utils import sample_title_queries
+    from query_encoder import encode_queries
+    from vector_store import NumpyVectorStore, load_or_build_numpy_index
+
+    chunks = ChunkStore.load(content_dir)
+    if chunks is None:
+        raise FileNotFoundError(f"Chunks file not found in {content_dir}")
+    section_index = SectionIndex.load_or_build(content_dir, model_name)
+    if section_index is None:
+        raise FileNotFoundError(f"{SECTIONS_FILENAME} not found in {content_dir}")
+
+    queries = sample_title_queries(chunks, n_queries)
+    query_vectors = encode_queries(queries, model_name=model_name)
+
+    index = load_or_build_numpy_index(content_dir, model_name, chunks=chunks)
+    store = NumpyVectorStore(index, columns=chunks.columns_for_ids(index.ids))
+    truth = [set(doc_id for doc_id, _ in hits) for hits in store.query_batch(query_vectors, top_k=top_k)]
+
+    print(f"{len(chunks)} chunks, {len(section_index)} sections, {len(queries)} queries, top_k={top_k}")
+    if not section_index.coarsens(len(chunks)):
+        print("Note: the section tier is not smaller than the chunk index; retrievers will skip it")
+    print(f"{'sections':>8} {'chunks/q':>9} {'ms/q':>8} {'recall':>7}")
+    start = time.perf_counter()
+    store.query_batch(query_vectors, top_k=top_k)
+    flat_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    print(f"{'all':>8} {len(index):>9} {flat_ms:>8.3f} {1.0:>7.3f}")
+
+    for n_sections in coarse_sections:
+        scored, recalls = [], []
+        start = time.perf_counter()
+        for q, vector in enumerate(query_vectors):
+            where = section_index.chunk_filter([vector], top_k=n_sections)
+            hits = store.query(vector, top_k=top_k, where=where)
+            scored.append(int(where.mask(store.columns).sum()))
+            recalls.append(len(truth[q] & set(doc_id for doc_id, _ in hits)) / max(len(truth[q]), 1))
+        ms = (time.perf_counter() - start) * 1000 / len(queries)
+        print(f"{n_sections:>8} {np.mean(scored):>9.1f} {ms:>8.3f} {np.mean(recalls):>7.3f}")
+
+
+def main():
+    """Build or benchmark the section index of a content directory"""
+    parser = argparse.ArgumentParser(description="Section-level coarse retrieval tier")
+    parser.add_argument("--content_dir", "-d",
+                        default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                             "extracted_content_manual"),
+                        help="Directory containing the extracted content")
+    parser.add_argument("--model", "-m", default=DEFAULT_TEXT_MODEL, help="Sentence transformer model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("build", help="Build (or refresh) the section index")
+
+    bench_parser = subparsers.add_parser("benchmark", help="Compare two-stage and flat chunk search")
+    bench_parser.add_argument("--queries", type=int, default=100, help="Number of queries")
+    bench_parser.add_argument("--top_k", "-k", type=int, default=10, help="Results per query")
+    bench_parser.add_argument("--sections", type=int, nargs="+", default=[5, 10, 20, 40],
+                              help="Coarse section counts to try")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        section_index = SectionIndex.load_or_build(args.content_dir, args.model)
+        if section_index is None:
+            raise SystemExit(f"{SECTIONS_FILENAME} not found in {args.content_dir}")
+        print(f"Section index ready with {len(section_index)} sections")
+    else:
+        benchmark(args.content_dir, n_queries=args.queries, top_k=args.top_k,
+                  coarse_sections=args.sections, model_name=args.model)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,60 +2,344 @@ import numpy as np
 import cv2
 import os
 from PIL import Image
-import google.generativeai as genai
 from dotenv import load_dotenv
-import chromadb
-from chromadb.utils import embedding_functions
-from sentence_transformers import SentenceTransformer
 import re  # Added for regex pattern matching
-import torch
 from pathlib import Path
-import matplotlib.pyplot as plt
-from transformers import CLIPProcessor, CLIPModel
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from image_index import ImageEmbeddingIndex, top_k_indices
+from clip_onnx import DEFAULT_ONNX_PATH, DEFAULT_TEXT_ONNX_PATH
+import model_registry
 
 # Load environment variables
 load_dotenv()
 
 # Initialize CLIP model
 model_name = "openai/clip-vit-base-patch32"
-device = "cuda" if torch.cuda.is_available() else "cpu"
-print(f"Using device: {device}")
+# Resolved on the first PyTorch use, so CLIP_BACKEND=onnx never imports torch
+_device = None
 
-# Load CLIP model and processor
-clip_model = CLIPModel.from_pretrained(model_name).to(device)
-clip_processor = CLIPProcessor.from_pretrained(model_name)
+# Backend for the image and text towers: "torch" (default) or "onnx" (int8 ONNX Runtime, CPU)
+clip_backend = os.getenv("CLIP_BACKEND", "torch").lower()
+
+clip_onnx_path = os.getenv("CLIP_ONNX_PATH", DEFAULT_ONNX_PATH)
+clip_text_onnx_path = os.getenv("CLIP_TEXT_ONNX_PATH", DEFAULT_TEXT_ONNX_PATH)
+clip_onnx_threads = int(os.getenv("CLIP_ONNX_THREADS", "0")) or None
+
+def get_device():
+    """Device of the PyTorch CLIP model ("cuda" if available, otherwise "cpu")"""
+    global _device
+    if _device is None:
+        import torch
+        _device = "cuda" if torch.cuda.is_available() else "cpu"
+        print(f"Using device: {_device}")
+    return _device
+
+# CLIP se carga en el primer uso a través del registro compartido de modelos
+def get_clip_model():
+    return model_registry.get_clip_model(model_name, get_device())
+
+def get_clip_processor():
+    return model_registry.get_clip_processor(model_name)
+
+def get_onnx_image_encoder():
+    """ONNX image encoder when CLIP_BACKEND=onnx, otherwise None"""
+    if clip_backend != "onnx":
+        return None
+    return model_registry.get_onnx_clip_image_encoder(clip_onnx_path, num_threads=clip_onnx_threads)
+
+def get_onnx_text_encoder():
+    """
+    ONNX text encoder when CLIP_BACKEND=onnx and the text tower was exported, otherwise None
+
+    Without the exported text tower, text queries still load the PyTorch
+    CLIP weights; that is logged once.
+    """
+    global _text_fallback_logged
+    if clip_backend != "onnx":
+        return None
+    if not os.path.exists(clip_text_onnx_path):
+        if not _text_fallback_logged:
+            print(f"CLIP_BACKEND=onnx but no text tower at {clip_text_onnx_path}: loading PyTorch CLIP "
+                  "for text queries (run 'python clip_onnx.py export')")
+            _text_fallback_logged = True
+        return None
+    return model_registry.get_onnx_clip_text_encoder(clip_text_onnx_path, num_threads=clip_onnx_threads)
+
+_text_fallback_logged = False
+
+# Batched encoding settings (images per forward pass, decode threads)
+encode_batch_size = int(os.getenv("CLIP_BATCH_SIZE", "32"))
+decode_workers = int(os.getenv("CLIP_DECODE_WORKERS", "4"))
 
 # --- Ranking de imágenes por similitud visual ---
 # Directorio de imágenes del manual
 images_folder = "../extracted_content_manual/images"  # Updated default path
+content_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "extracted_content_manual")
+
+def to_rgb_pil(image, bgr=False):
+    """
+    Convert a query image to an RGB PIL image without touching the disk
+
+    Args:
+        image: numpy array, PIL image or path to an image file
+        bgr: True if a numpy array comes from OpenCV (BGR/BGRA channel order)
+
+    Returns:
+        RGB PIL image
+    """
+    if isinstance(image, np.ndarray):
+        if bgr and image.ndim == 3 and image.shape[2] == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        elif bgr and image.ndim == 3 and image.shape[2] == 4:
+            image = cv2.cvtColor(image, cv2.COLOR_BGRA2RGB)
+        return Image.fromarray(image).convert("RGB")
+    if isinstance(image, Image.Image):
+        return image.convert("RGB")
+    return Image.open(image).convert("RGB")
+
+def image_features(pixel_values):
+    """
+    Run the configured image tower on preprocessed pixels
+
+    Args:
+        pixel_values: float32 array (n, 3, 224, 224) from clip_processor
+
+    Returns:
+        L2-normalized float32 embeddings of shape (n, dim)
+    """
+    onnx_image_encoder = get_onnx_image_encoder()
+    if onnx_image_encoder is not None:
+        return onnx_image_encoder.encode(pixel_values)
+
+    import torch
+    with torch.no_grad():
+        img_emb = get_clip_model().get_image_features(pixel_values=torch.from_numpy(pixel_values).to(get_device()))
+        img_emb = img_emb / img_emb.norm(p=2, dim=-1, keepdim=True)
+    return img_emb.cpu().numpy().astype(np.float32)
+
+def embedding_dim():
+    onnx_image_encoder = get_onnx_image_encoder()
+    if onnx_image_encoder is not None:
+        return onnx_image_encoder.embedding_dim
+    return get_clip_model().config.projection_dim
+
+def encode_pil_image(img):
+    """Return the L2-normalized CLIP embedding of an RGB PIL image"""
+    pixel_values = get_clip_processor()(images=img, return_tensors="np")["pixel_values"].astype(np.float32)
+    return image_features(pixel_values)[0]
+
+def encode_query_image(image, bgr=False):
+    """
+    Embed a query image entirely in memory
+
+    Args:
+        image: numpy array (e.g. a crop), PIL image or path
+        bgr: True if a numpy array is in OpenCV's BGR order
+
+    Returns:
+        L2-normalized embedding as a 1-D float32 array
+    """
+    return encode_pil_image(to_rgb_pil(image, bgr=bgr)).astype(np.float32)
+
+def _preprocess_image(image):
+    """Decode and resize one image into CLIP pixel values (runs in the decode pool)"""
+    return get_clip_processor()(images=to_rgb_pil(image), return_tensors="np")["pixel_values"][0].astype(np.float32)
+
+def _iter_preprocessed_batches(images, batch_size, num_workers, prefetch_batches=2):
+    """
+    Yield (batch_items, pixel_values_or_exceptions) while the next batches decode
+
+    At most prefetch_batches batches are decoding at once, so memory stays
+    bounded regardless of how many images are encoded.
+    """
+    batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append((batch, [pool.submit(_preprocess_image, item) for item in batch]))
+            if len(pending) > prefetch_batches:
+                yield _collect_batch(*pending.popleft())
+        while pending:
+            yield _collect_batch(*pending.popleft())
+
+def _collect_batch(batch, futures):
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e:
+            results.append(e)
+    return batch, results
+
+def iter_image_embeddings(images, batch_size=None, num_workers=None):
+    """
+    Stream batched CLIP embeddings as each batch is encoded
+
+    Callers that only need scores can consume one batch at a time, so no
+    more than a couple of batches of pixels or embeddings are alive at once.
+
+    Yields:
+        Tuple (batch_items, embeddings) for the items of each batch that
+        loaded successfully
+    """
+    batch_size = batch_size or encode_batch_size
+    num_workers = num_workers or decode_workers
+
+    for batch, pixel_values in _iter_preprocessed_batches(list(images), batch_size, num_workers):
+        items = []
+        tensors = []
+        for item, values in zip(batch, pixel_values):
+            if isinstance(values, Exception):
+                print(f"Error processing {item}: {values}")
+                continue
+            tensors.append(values)
+            items.append(item)
+        if tensors:
+            yield items, image_features(np.stack(tensors))
+
+def encode_images(images, batch_size=None, num_workers=None):
+    """
+    Encode many images with batched CLIP forward passes
+
+    A thread pool decodes and resizes upcoming images while the model runs
+    on the current batch. Images that fail to load are reported and skipped.
+
+    Args:
+        images: List of image paths or PIL images
+        batch_size: Images per forward pass (default CLIP_BATCH_SIZE or 32)
+        num_workers: Decode threads (default CLIP_DECODE_WORKERS or 4)
 
-def rank_similar_images(input_image, top_k=5, image_paths_list=None):
-    """Rank manual images by similarity to input image"""
-    # Si input_image es un array (ej: crop), convertir a PIL Image
-    if isinstance(input_image, np.ndarray):
-        input_pil = Image.fromarray(input_image)
-        # Guardar temporalmente
-        temp_path = "temp_query_image.jpg"
-        input_pil.save(temp_path)
-        query_path = temp_path
+    Returns:
+        Tuple (embeddings, encoded_images): L2-normalized float32 matrix and
+        the input items it was computed for, in input order
+    """
+    embeddings = []
+    encoded = []
+    for batch_items, batch_embs in iter_image_embeddings(images, batch_size=batch_size, num_workers=num_workers):
+        embeddings.append(batch_embs)
+        encoded.extend(batch_items)
+
+    if not embeddings:
+        return np.zeros((0, embedding_dim()), dtype=np.float32), encoded
+    return np.vstack(embeddings).astype(np.float32), encoded
+
+def encode_patch_tokens(image, grid_long_side=21, bgr=False):
+    """
+    Encode an image into a grid of CLIP patch tokens in the joint embedding space
+
+    The image keeps its aspect ratio: it is resized so its long side spans
+    grid_long_side patches, and the position embeddings are interpolated
+    to that grid. Each token goes through the same layer norm and projection
+    as the pooled image embedding, so averaging the tokens under a box gives
+    a region embedding comparable with encode_query_image.
+
+    Args:
+        image: numpy array, PIL image or path
+        grid_long_side: Number of patches along the image's long side
+        bgr: True if a numpy array is in OpenCV's BGR order
+
+    Returns:
+        float32 array of shape (grid_h, grid_w, dim), not normalized
+    """
+    # Siempre con el modelo PyTorch: el grafo ONNX solo expone el embedding final
+    import torch
+    clip_model = get_clip_model()
+    img = to_rgb_pil(image, bgr=bgr)
+    width, height = img.size
+    patch_size = clip_model.config.vision_config.patch_size
+    if width >= height:
+        grid_w, grid_h = grid_long_side, max(1, round(grid_long_side * height / width))
     else:
-        # Si ya es una ruta
-        query_path = input_image
+        grid_w, grid_h = max(1, round(grid_long_side * width / height)), grid_long_side
+
+    resized = img.resize((grid_w * patch_size, grid_h * patch_size), Image.BICUBIC)
+    image_processor = get_clip_processor().image_processor
+    mean = np.array(image_processor.image_mean, dtype=np.float32)
+    std = np.array(image_processor.image_std, dtype=np.float32)
+    pixels = (np.asarray(resized, dtype=np.float32) / 255.0 - mean) / std
+    pixel_values = torch.from_numpy(pixels.transpose(2, 0, 1)).unsqueeze(0).to(get_device())
+
+    with torch.no_grad():
+        hidden = clip_model.vision_model(pixel_values=pixel_values, interpolate_pos_encoding=True).last_hidden_state
+        # Descartar el token CLS; proyectar los tokens de parche
+        tokens = clip_model.visual_projection(clip_model.vision_model.post_layernorm(hidden[0, 1:]))
+    return tokens.reshape(grid_h, grid_w, -1).cpu().numpy().astype(np.float32)
+
+def encode_query_text(text):
+    """
+    Embed a text query with the CLIP text tower (ONNX when CLIP_BACKEND=onnx
+    and the text tower was exported, otherwise PyTorch)
+
+    Returns:
+        L2-normalized embedding as a 1-D float32 array, in the same space as
+        the image embeddings
+    """
+    onnx_encoder = get_onnx_text_encoder()
+    if onnx_encoder is not None:
+        return onnx_encoder.encode([text])[0].astype(np.float32)
 
-    # Obtener embedding de la imagen query con el mismo modelo CLIP ya cargado
+    import torch
+    inputs = get_clip_processor()(text=[text], return_tensors="pt", padding=True, truncation=True).to(get_device())
+    with torch.no_grad():
+        text_emb = get_clip_model().get_text_features(**inputs)
+        text_emb = text_emb / text_emb.norm(p=2, dim=-1, keepdim=True)
+    return text_emb.cpu().numpy()[0].astype(np.float32)
+
+def encode_image_paths(paths, batch_size=None, num_workers=None):
+    """Return L2-normalized CLIP embeddings, one row per image path"""
+    embeddings, encoded = encode_images(paths, batch_size=batch_size, num_workers=num_workers)
+    if len(encoded) != len(paths):
+        encoded = set(encoded)
+        failed = [p for p in paths if p not in encoded]
+        raise ValueError(f"Could not encode {len(failed)} images, e.g. {failed[0]}")
+    return embeddings
+
+# Índice precalculado de embeddings (python image_index.py para construirlo)
+image_index = ImageEmbeddingIndex.load(content_dir, model_name=model_name)
+if image_index is not None:
+    print(f"Loaded CLIP index with {len(image_index)} images")
+else:
+    print("CLIP index not found, images will be encoded per request")
+
+def rank_similar_images(input_image, top_k=5, image_paths_list=None, bgr=False):
+    """
+    Rank manual images by similarity to input image
+
+    Args:
+        input_image: Query as a numpy array (e.g. a crop), PIL image or path
+        top_k: Number of results to return
+        image_paths_list: Candidate image paths (defaults to every manual image)
+        bgr: True if input_image is a numpy array in OpenCV's BGR order
+
+    Returns:
+        List of (path, score) tuples sorted by descending similarity
+    """
+    # Embedding de la imagen query en memoria, sin archivo temporal
     try:
-        inputs_query = clip_processor(images=Image.open(query_path).convert("RGB"), return_tensors="pt").to(device)
-        with torch.no_grad():
-            query_emb = clip_model.get_image_features(**inputs_query)
-            query_emb = query_emb / query_emb.norm(p=2, dim=-1, keepdim=True)
-        query_emb = query_emb.cpu().numpy()[0]
-        print(f"Successfully processed query image: {query_path}")
+        query_emb = encode_query_image(input_image, bgr=bgr)
+        print("Successfully processed query image")
     except Exception as e:
-        print(f"Error processing query image {query_path}: {str(e)}")
+        print(f"Error processing query image: {str(e)}")
         return []
 
+    return rank_by_embedding(query_emb, top_k=top_k, image_paths_list=image_paths_list)
+
+def rank_by_embedding(query_emb, top_k=5, image_paths_list=None, index=None):
+    """
+    Rank manual images by similarity to an already computed query embedding
+
+    Args:
+        query_emb: L2-normalized CLIP image embedding of the query
+        top_k: Number of results to return
+        image_paths_list: Candidate image paths (defaults to every manual image)
+        index: ImageEmbeddingIndex of the manual the candidates belong to
+            (defaults to the index of the default manual)
+
+    Returns:
+        List of (path, score) tuples sorted by descending similarity
+    """
     # Procesar todas las imágenes en el directorio o lista proporcionada
-    similarities = []
     if image_paths_list is None:
         print(f"Looking for images in folder: {images_folder}")
         image_paths = list(Path(images_folder).glob("*.jpeg")) + list(Path(images_folder).glob("*.jpg")) + list(Path(images_folder).glob("*.png"))
@@ -83,70 +367,98 @@ def rank_similar_images(input_image, top_k=5, image_paths_list=None):
         print("Warning: No image paths found to process")
         return []
 
-    for img_path in image_paths:
-        try:
-            img = Image.open(img_path).convert("RGB")
-            inputs = clip_processor(images=img, return_tensors="pt").to(device)
-            with torch.no_grad():
-                img_emb = clip_model.get_image_features(**inputs)
-                img_emb = img_emb / img_emb.norm(p=2, dim=-1, keepdim=True)
-            img_emb = img_emb.cpu().numpy()[0]
-
-            # Calcular similitud
-            similarity = np.dot(query_emb, img_emb)
-            similarities.append((str(img_path), similarity, img))
-        except Exception as e:
-            print(f"Error processing {img_path}: {e}")
-
-    # Ordenar por similitud (descendente)
-    similarities.sort(key=lambda x: x[1], reverse=True)
-
-    # Visualizar resultados
-    n_images = min(top_k + 1, len(similarities) + 1)
-
-    # Manejo especial si no hay suficientes imágenes
-    if n_images <= 1:
-        fig, ax = plt.subplots(figsize=(5, 5))
-        if isinstance(input_image, np.ndarray):
-            ax.imshow(cv2.cvtColor(input_image, cv2.COLOR_RGB2BGR))
-        else:
-            ax.imshow(Image.open(query_path))
-        ax.set_title("Query Image")
-        ax.axis('off')
+    # Solo se guardan puntuaciones e ids; nunca las imágenes decodificadas
+    scored_paths = []
+    score_parts = []
+
+    # Imágenes ya indexadas: una sola multiplicación matricial
+    index = image_index if index is None else index
+    if index is not None:
+        rows, indexed_paths, missing_paths = index.split_candidates(image_paths)
+        score_parts.append(index.score(query_emb, rows))
+        scored_paths.extend(indexed_paths)
     else:
-        fig, axes = plt.subplots(1, n_images, figsize=(15, 4))
+        missing_paths = image_paths
+
+    # Imágenes sin indexar: se codifican y puntúan lote a lote
+    for batch_paths, batch_embs in iter_image_embeddings(missing_paths):
+        score_parts.append(batch_embs @ query_emb)
+        scored_paths.extend(batch_paths)
+
+    if not scored_paths:
+        return []
+    scores = np.concatenate(score_parts).astype(np.float32)
+
+    # Top-k sin ordenar todas las puntuaciones (descendente)
+    return [(str(scored_paths[i]), float(scores[i])) for i in top_k_indices(scores, top_k)]
 
-        # Asegúrate de que axes es siempre una lista
-        if n_images == 2:  # Solo 2 imágenes (query + 1 similar)
-            axes = [axes[0], axes[1]]
+def search_images_by_text(text, top_k=2, index=None):
+    """
+    Find the manual figures that best match a text query
 
-        # Imagen query
-        if isinstance(input_image, np.ndarray):
-            axes[0].imshow(input_image)  # Ya está en RGB si viene de img_rgb
-        else:
-            axes[0].imshow(Image.open(query_path))
-        axes[0].set_title("Query Image")
-        axes[0].axis('off')
+    Args:
+        text: User question or description
+        top_k: Number of figures to return
+        index: ImageEmbeddingIndex of the manual to search (defaults to the
+            index of the default manual)
 
-        # Imágenes similares
-        for i in range(min(top_k, len(similarities))):
-            path, score, img = similarities[i]
-            axes[i+1].imshow(img)
-            axes[i+1].set_title(f"Score: {score:.4f}")
-            axes[i+1].axis('off')
+    Returns:
+        List of (filename, score) tuples, best first; empty if the CLIP
+        index has not been built
+    """
+    index = image_index if index is None else index
+    if index is None or len(index) == 0:
+        return []
+
+    scores = index.embeddings @ encode_query_text(text)
+    return [
+        (os.path.basename(index.manifest[i]["path"]), float(scores[i]))
+        for i in top_k_indices(scores, top_k)
+    ]
+
+def save_ranking_plot(input_image, similar_images, output_path, bgr=False):
+    """
+    Debug helper: render the query next to its ranked matches into an image file
+
+    matplotlib is imported here, with a non-interactive backend, so it stays
+    out of the server's import graph and the ranking hot path.
 
-    plt.tight_layout()
-    #plt.show()
+    Args:
+        input_image: Query as a numpy array, PIL image or path
+        similar_images: (path, score) tuples as returned by rank_similar_images
+        output_path: File to write (format taken from the extension)
+        bgr: True if input_image is a numpy array in OpenCV's BGR order
 
-    # Limpiar archivo temporal si fue creado
-    if isinstance(input_image, np.ndarray) and os.path.exists(temp_path):
-        os.remove(temp_path)
+    Returns:
+        output_path
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    n_images = len(similar_images) + 1
+    fig, axes = plt.subplots(1, n_images, figsize=(3 * n_images, 4), squeeze=False)
+    axes = axes[0]
+
+    # Imagen query
+    axes[0].imshow(to_rgb_pil(input_image, bgr=bgr))
+    axes[0].set_title("Query Image")
+    axes[0].axis('off')
+
+    # Imágenes similares
+    for ax, (path, score) in zip(axes[1:], similar_images):
+        ax.imshow(Image.open(path).convert("RGB"))
+        ax.set_title(f"Score: {score:.4f}")
+        ax.axis('off')
 
-    # Devolver los resultados
-    return [(path, score) for path, score, _ in similarities[:top_k]]
+    fig.tight_layout()
+    fig.savefig(output_path)
+    plt.close(fig)
+    return output_path
 
 """# Usar la función con la región recortada
 similar_images = rank_similar_images(crop, top_k=5)
 print("\nImágenes más similares del manual:")
 for i, (path, score) in enumerate(similar_images, 1):
-    print(f"{i}. {os.path.basename(path)}: {score:.4f}")"""
\ No newline at end of file
+    print(f"{i}. {os.path.basename(path)}: {score:.4f}")
+save_ranking_plot(crop, similar_images, "similar_images.png")"""
\ No newline at end of file
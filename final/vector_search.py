@@ -0,0 +1,206 @@
+import os
+import json
+import numpy as np
+
+# Files written inside <content_dir>/vector_index
+INDEX_DIRNAME = "vector_index"
+EMBEDDINGS_FILENAME = "chunk_embeddings.npy"
+META_FILENAME = "chunk_index.json"
+
+
+def top_k_indices(scores, k):
+    """
+    Indices of the k highest scores, best first
+
+    Uses argpartition, so only the k winners are sorted.
+    """
+    if k <= 0 or len(scores) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def top_k_indices_batch(scores, k):
+    """Row-wise top_k_indices for a (n_queries, n_items) score matrix"""
+    n_items = scores.shape[1]
+    if k <= 0 or n_items == 0:
+        return np.zeros((scores.shape[0], 0), dtype=np.int64)
+    if k >= n_items:
+        return np.argsort(-scores, axis=1, kind="stable")
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1)
+
+
+def normalize_rows(matrix):
+    """L2-normalize each row (zero rows are left as they are)"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+class NumpyVectorIndex:
+    """
+    In-process exact cosine search over a normalized embedding matrix
+
+    Vectors are normalized once when the index is built, so a query is a
+    single matrix-vector product plus an argpartition top-k.
+    """
+
+    def __init__(self, embeddings, ids, meta=None):
+        """
+        Args:
+            embeddings: (n, dim) matrix with L2-normalized rows
+            ids: List of n ids, one per row
+            meta: Free-form dict saved with the index (model, content version...)
+        """
+        self.embeddings = embeddings
+        self.ids = list(ids)
+        self.meta = dict(meta or {})
+        self.row_by_id = {doc_id: i for i, doc_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def dim(self):
+        return self.embeddings.shape[1] if self.embeddings.ndim == 2 else 0
+
+    @classmethod
+    def build(cls, ids, vectors, meta=None):
+        """Index raw vectors; rows are normalized here"""
+        return cls(normalize_rows(vectors), ids, meta=meta)
+
+    @classmethod
+    def from_collection(cls, collection, batch_size=1000, meta=None):
+        """
+        Copy the stored embeddings of a Chroma collection into memory
+
+        Lets callers score chunks against vectors Chroma already holds
+        without re-encoding them.
+        """
+        ids, vectors = [], []
+        total = collection.count()
+        for offset in range(0, total, batch_size):
+            batch = collection.get(include=["embeddings"], limit=batch_size, offset=offset)
+            ids.extend(batch["ids"])
+            vectors.extend(batch["embeddings"])
+        if not ids:
+            return cls(np.zeros((0, 0), dtype=np.float32), [], meta=meta)
+        return cls.build(ids, np.asarray(vectors, dtype=np.float32), meta=meta)
+
+    @staticmethod
+    def index_dir(content_dir, dirname=INDEX_DIRNAME):
+        return os.path.join(content_dir, dirname)
+
+    def save(self, content_dir, dtype=np.float32, dirname=INDEX_DIRNAME):
+        """
+        Write the matrix (.npy) and its ids/metadata to <content_dir>/vector_index
+
+        Args:
+            dtype: np.float32, or np.float16 to halve the file size
+            dirname: Directory under content_dir (for indexes other than the chunk one)
+        """
+        index_dir = self.index_dir(content_dir, dirname)
+        os.makedirs(index_dir, exist_ok=True)
+
+        np.save(os.path.join(index_dir, EMBEDDINGS_FILENAME), np.asarray(self.embeddings, dtype=dtype))
+        meta = dict(self.meta, dtype=np.dtype(dtype).name, count=len(self.ids))
+        with open(os.path.join(index_dir, META_FILENAME), "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "ids": self.ids}, f)
+
+    @classmethod
+    def load(cls, content_dir, dirname=INDEX_DIRNAME):
+        """
+        Memory-map a saved index
+
+        float32 matrices stay memory-mapped; float16 ones are widened to
+        float32 once, since NumPy has no fast float16 matrix product.
+
+        Returns:
+            NumpyVectorIndex, or None if no index has been saved
+        """
+        index_dir = cls.index_dir(content_dir, dirname)
+        embeddings_path = os.path.join(index_dir, EMBEDDINGS_FILENAME)
+        meta_path = os.path.join(index_dir, META_FILENAME)
+        if not (os.path.exists(embeddings_path) and os.path.exists(meta_path)):
+            return None
+
+        with open(meta_path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        embeddings = np.load(embeddings_path, mmap_mode="r")
+        if embeddings.dtype != np.float32:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+
+        if embeddings.shape[0] != len(saved["ids"]):
+            print(f"Warning: {embeddings_path} does not match its ids, ignoring it")
+            return None
+        return cls(embeddings, saved["ids"], meta=saved["meta"])
+
+    def search(self, query_vector, top_k=3):
+        """
+        Args:
+            query_vector: 1-D query embedding (normalized here)
+            top_k: Number of results
+
+        Returns:
+            List of (id, cosine similarity) tuples, best first
+        """
+        query = normalize_rows(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+        scores = self.embeddings @ query
+        return [(self.ids[i], float(scores[i])) for i in top_k_indices(scores, top_k)]
+
+    def score_ids(self, query_vector, ids):
+        """
+        Cosine similarity of the query to the given ids, in one gather + product
+
+        Returns:
+            float32 array aligned with ids; ids not in the index get -inf
+        """
+        query = normalize_rows(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+        rows = np.array([self.row_by_id.get(str(doc_id), -1) for doc_id in ids], dtype=np.int64)
+        scores = np.full(len(rows), -np.inf, dtype=np.float32)
+        known = rows >= 0
+        if known.any():
+            scores[known] = self.embeddings[rows[known]] @ query
+        return scores
+
+    def rerank(self, chunks, query_vector, top_k=3):
+        """
+        Order chunk dicts by cosine similarity of their stored vectors to the query
+
+        Returns:
+            List of (chunk, score) tuples, best first; the chunks are not modified
+        """
+        if not chunks:
+            return []
+        scores = self.score_ids(query_vector, [chunk["id"] for chunk in chunks])
+        return [(chunks[i], float(scores[i])) for i in top_k_indices(scores, top_k)]
+
+    def search_batch(self, query_vectors, top_k=3, rows=None):
+        """
+        Answer several queries with one matrix-matrix product
+
+        Args:
+            query_vectors: (n_queries, dim) query embeddings
+            top_k: Number of results per query
+            rows: Optional row numbers to restrict the search to (a
+                prefilter); only those rows are read and scored
+
+        Returns:
+            One list of (id, cosine similarity) tuples per query
+        """
+        queries = normalize_rows(np.asarray(query_vectors, dtype=np.float32).reshape(len(query_vectors), -1))
+        if rows is None:
+            rows = np.arange(len(self.ids))
+            scores = queries @ self.embeddings.T
+        else:
+            rows = np.asarray(rows, dtype=np.int64)
+            scores = queries @ self.embeddings[rows].T
+        top = top_k_indices_batch(scores, top_k)
+        return [
+            [(self.ids[rows[i]], float(scores[q, i])) for i in top[q]]
+            for q in range(len(queries))
+        ]
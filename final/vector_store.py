@@ -0,0 +1,581 @@
+import os
+import time
+import argparse
+from abc import ABC, abstractmethod
+import numpy as np
+from chunk_store import ChunkStore, as_chunk_store
+from content_index import content_version
+from vector_search import NumpyVectorIndex, normalize_rows, EMBEDDINGS_FILENAME
+from model_registry import get_text_encoder, get_embedding_function
+
+DEFAULT_TEXT_MODEL = "all-MiniLM-L6-v2"
+BACKENDS = ("chroma", "numpy", "hnsw")
+HNSW_FILENAME = "hnsw_index.bin"
+
+
+def open_chroma_collection(content_dir, model_name=DEFAULT_TEXT_MODEL, create=False):
+    """
+    Open the pdf_chunks_<manual> collection of <content_dir>/chroma_db
+
+    Args:
+        content_dir: Directory with extracted content
+        model_name: SentenceTransformer used as the collection's embedding function
+        create: Create the database and collection if missing (ingest);
+            otherwise a missing database or collection is an error
+
+    Returns:
+        Chroma collection
+    """
+    import chromadb
+
+    chroma_dir = os.path.join(content_dir, "chroma_db")
+    if not os.path.exists(chroma_dir):
+        if not create:
+            raise FileNotFoundError(
+                f"ChromaDB directory not found at {chroma_dir}. "
+                "Please run retrieval.py first to create the vector database."
+            )
+        os.makedirs(chroma_dir)
+
+    chroma_client = chromadb.PersistentClient(path=chroma_dir)
+    embedding_function = get_embedding_function(model_name)
+    collection_name = f"pdf_chunks_{os.path.basename(os.path.normpath(content_dir))}"
+
+    try:
+        collection = chroma_client.get_collection(name=collection_name, embedding_function=embedding_function)
+        print(f"Connected to existing persistent ChromaDB collection: {collection_name}")
+    except Exception as e:
+        if not create:
+            raise ValueError(
+                f"ChromaDB collection '{collection_name}' not found or could not be accessed. "
+                f"Error: {str(e)}. "
+                "Please run retrieval.py first to create the collection."
+            )
+        collection = chroma_client.create_collection(name=collection_name, embedding_function=embedding_function)
+        print(f"Created new persistent ChromaDB collection: {collection_name}")
+    return collection
+
+
+def has_filter_metadata(collection):
+    """
+    True if the collection's chunks carry the typed page metadata ChunkFilter needs
+
+    Collections ingested before page filters existed store every field as a
+    string and have no end_page, so page filters match none of their chunks.
+    """
+    sample = collection.get(limit=1, include=["metadatas"])
+    return not sample["metadatas"] or "end_page" in (sample["metadatas"][0] or {})
+
+
+def upgrade_chunk_metadata(collection, chunks, batch_size=100):
+    """
+    Rewrite old chunk metadata in place with ChunkStore.metadata
+
+    The stored embeddings are kept, so nothing is re-encoded.
+
+    Args:
+        collection: Chroma collection of the manual's chunks
+        chunks: ChunkStore of the manual
+
+    Returns:
+        True if the metadata was rewritten
+    """
+    if has_filter_metadata(collection):
+        return False
+
+    print("Updating chunk metadata in ChromaDB for page filters...")
+    ids = [str(chunk["id"]) for chunk in chunks]
+    for i in range(0, len(ids), batch_size):
+        collection.update(
+            ids=ids[i:i + batch_size],
+            metadatas=chunks.metadata[i:i + batch_size]
+        )
+    return True
+
+
+class VectorStore(ABC):
+    """
+    Interface of the chunk vector stores
+
+    Every backend answers queries with (id, cosine similarity) lists, best
+    first, so callers and the benchmark can swap them freely.
+    """
+
+    name = None
+
+    @abstractmethod
+    def __len__(self):
+        raise NotImplementedError
+
+    @classmethod
+    @abstractmethod
+    def build(cls, content_dir, ids, vectors, metadatas=None, model_name=DEFAULT_TEXT_MODEL):
+        """
+        Create the backend's persistent store for a manual and return it opened
+
+        An existing store is replaced: afterwards it holds exactly these vectors.
+
+        Args:
+            content_dir: Directory with extracted content, where the store is written
+            ids: Chunk ids, one per vector
+            vectors: Chunk embeddings
+            metadatas: Optional typed chunk metadata (ChunkStore.metadata
+                entries), needed for filtered queries
+            model_name: SentenceTransformer the vectors come from
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def add(self, ids, vectors, documents=None, metadatas=None):
+        """
+        Add vectors (one per id) and persist them
+
+        Stores created without a content_dir (e.g. NumpyVectorStore(index))
+        only keep the new vectors in memory. documents are kept where the
+        backend supports them.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def query_batch(self, query_vectors, top_k=10, where=None):
+        """
+        Args:
+            query_vectors: Query embeddings
+            top_k: Number of results per query
+            where: Optional ChunkFilter; only matching chunks are searched
+
+        Returns:
+            One list of (id, cosine similarity) tuples per query vector
+        """
+        raise NotImplementedError
+
+    def query(self, query_vector, top_k=10, where=None):
+        """(id, cosine similarity) list for a single query vector"""
+        return self.query_batch([query_vector], top_k=top_k, where=where)[0]
+
+    @abstractmethod
+    def embedding_index(self):
+        """NumpyVectorIndex of the stored vectors (used to rerank chunks)"""
+        raise NotImplementedError
+
+
+class ChromaVectorStore(VectorStore):
+    """Chroma collection behind the VectorStore interface"""
+
+    name = "chroma"
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._embedding_index = None
+        # Without typed page metadata, filters would silently match nothing
+        self.filterable = has_filter_metadata(collection)
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        # Chroma returns distances; the sentence vectors are unit length, so
+        # squared l2 = 2 - 2 cos and cosine/ip distance = 1 - cos
+        self._to_similarity = (lambda d: 1.0 - d / 2.0) if space == "l2" else (lambda d: 1.0 - d)
+
+    def __len__(self):
+        return self.collection.count()
+
+    @classmethod
+    def build(cls, content_dir, ids, vectors, metadatas=None, model_name=DEFAULT_TEXT_MODEL):
+        collection = open_chroma_collection(content_dir, model_name, create=True)
+        # Chunks no longer in the manual are dropped; the rest are overwritten by add()
+        keep = set(str(doc_id) for doc_id in ids)
+        stale = [doc_id for doc_id in collection.get(include=[])["ids"] if doc_id not in keep]
+        if stale:
+            collection.delete(ids=stale)
+        store = cls(collection)
+        store.add(ids, vectors, metadatas=metadatas)
+        store.filterable = has_filter_metadata(collection)
+        return store
+
+    def add(self, ids, vectors, documents=None, metadatas=None, batch_size=100):
+        # upsert: ids already in the collection get the new vectors (add would keep the old ones)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        for i in range(0, len(ids), batch_size):
+            end = min(i + batch_size, len(ids))
+            self.collection.upsert(
+                ids=[str(doc_id) for doc_id in ids[i:end]],
+                embeddings=vectors[i:end].tolist(),
+                documents=documents[i:end] if documents is not None else None,
+                metadatas=metadatas[i:end] if metadatas is not None else None
+            )
+        self._embedding_index = None
+
+    def query_batch(self, query_vectors, top_k=10, where=None):
+        # The filter runs inside Chroma, on the typed page/section metadata
+        where_clause = where.where() if where else None
+        if where_clause is not None and not self.filterable:
+            print(f"WARNING: ChromaDB collection '{self.collection.name}' has no end_page metadata; "
+                  f"ignoring {where}. Run retrieval.py to upgrade it.")
+            where_clause = None
+        results = self.collection.query(
+            query_embeddings=[[float(x) for x in vector] for vector in query_vectors],
+            n_results=top_k,
+            where=where_clause,
+            include=["distances"]
+        )
+        return [
+            [(doc_id, float(self._to_similarity(distance))) for doc_id, distance in zip(ids, distances)]
+            for ids, distances in zip(results["ids"], results["distances"])
+        ]
+
+    def embedding_index(self):
+        if self._embedding_index is None:
+            self._embedding_index = NumpyVectorIndex.from_collection(self.collection)
+        return self._embedding_index
+
+
+def _metadata_columns(metadatas):
+    """Filter columns (as ChunkStore.columns_for_ids) from typed metadata; missing fields match nothing"""
+    return {
+        "start_page": np.array([m.get("start_page", -1) for m in metadatas], dtype=np.int32),
+        "end_page": np.array([m.get("end_page", -1) for m in metadatas], dtype=np.int32),
+        "section_id": np.array([str(m.get("section_id", "")) for m in metadatas], dtype=object),
+    }
+
+
+def _filtered_rows(columns, where):
+    """Row numbers matching a ChunkFilter, or None for no filter"""
+    if not where:
+        return None
+    if columns is None:
+        raise ValueError("This vector store has no chunk metadata to filter on")
+    return np.flatnonzero(where.mask(columns))
+
+
+class NumpyVectorStore(VectorStore):
+    """Exact brute-force search over a (memory-mapped) NumpyVectorIndex"""
+
+    name = "numpy"
+
+    def __init__(self, index, columns=None, content_dir=None):
+        """
+        Args:
+            index: NumpyVectorIndex
+            columns: Chunk metadata columns aligned with the index rows
+                (ChunkStore.columns_for_ids), needed for filtered queries
+            content_dir: Where the index is saved; add() rewrites it there
+                (None keeps added vectors in memory only)
+        """
+        self.index = index
+        self.columns = columns
+        self.content_dir = content_dir
+
+    def __len__(self):
+        return len(self.index)
+
+    @classmethod
+    def build(cls, content_dir, ids, vectors, metadatas=None, model_name=DEFAULT_TEXT_MODEL):
+        meta = {"model": model_name, "content_version": content_version(content_dir, ("rag_chunks.json",))}
+        NumpyVectorIndex.build([str(doc_id) for doc_id in ids], vectors, meta=meta).save(content_dir)
+        # Reload so the matrix is served from the memory-mapped file
+        columns = _metadata_columns(metadatas) if metadatas is not None else None
+        return cls(NumpyVectorIndex.load(content_dir), columns=columns, content_dir=content_dir)
+
+    def add(self, ids, vectors, documents=None, metadatas=None):
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1))
+        embeddings = np.vstack([self.index.embeddings, vectors]) if len(self.index) else vectors
+        self.index = NumpyVectorIndex(embeddings, self.index.ids + [str(doc_id) for doc_id in ids], meta=self.index.meta)
+        if self.columns is not None:
+            # Filter columns of the new rows come from their metadata (no match if absent)
+            added = _metadata_columns(metadatas or [{}] * len(ids))
+            self.columns = {name: np.concatenate([self.columns[name], added[name]]) for name in added}
+        if self.content_dir is not None:
+            self.index.save(self.content_dir)
+            self.index = NumpyVectorIndex.load(self.content_dir)
+
+    def query_batch(self, query_vectors, top_k=10, where=None):
+        # A filter becomes a row prefilter: only the matching slice is scored
+        rows = _filtered_rows(self.columns, where)
+        return self.index.search_batch(np.asarray(query_vectors, dtype=np.float32), top_k=top_k, rows=rows)
+
+    def embedding_index(self):
+        return self.index
+
+
+class HnswVectorStore(VectorStore):
+    """
+    Approximate search with an hnswlib HNSW graph
+
+    The exact vectors stay in a NumpyVectorIndex next to the graph; they are
+    the source the graph is built from and serve reranking.
+    """
+
+    name = "hnsw"
+
+    def __init__(self, hnsw, index, ef_search=64, columns=None, content_dir=None):
+        self.hnsw = hnsw
+        self.index = index
+        self.columns = columns
+        # Where vectors and graph are saved; add() rewrites both (None: memory only)
+        self.content_dir = content_dir
+        self.hnsw.set_ef(ef_search)
+
+    def __len__(self):
+        return len(self.index)
+
+    @staticmethod
+    def _new_graph(dim, max_elements, m=16, ef_construction=200):
+        try:
+            import hnswlib
+        except ImportError:
+            raise ImportError("The hnsw vector backend needs hnswlib (pip install hnswlib)")
+        graph = hnswlib.Index(space="cosine", dim=dim)
+        graph.init_index(max_elements=max(max_elements, 1), ef_construction=ef_construction, M=m)
+        return graph
+
+    @classmethod
+    def build(cls, content_dir, ids, vectors, metadatas=None, model_name=DEFAULT_TEXT_MODEL):
+        # The graph is rebuilt because the vectors just written are newer than it
+        numpy_store = NumpyVectorStore.build(content_dir, ids, vectors, metadatas=metadatas, model_name=model_name)
+        return cls.from_numpy_index(content_dir, numpy_store.index, columns=numpy_store.columns)
+
+    @classmethod
+    def from_numpy_index(cls, content_dir, index, ef_search=64, columns=None):
+        """
+        Open the graph saved for a NumpyVectorIndex, building it if missing or older than the vectors
+        """
+        index_dir = NumpyVectorIndex.index_dir(content_dir)
+        graph_path = os.path.join(index_dir, HNSW_FILENAME)
+        vectors_path = os.path.join(index_dir, EMBEDDINGS_FILENAME)
+
+        graph = cls._new_graph(index.dim, len(index))
+        if (os.path.exists(graph_path) and os.path.exists(vectors_path)
+                and os.path.getmtime(graph_path) >= os.path.getmtime(vectors_path)):
+            graph.load_index(graph_path, max_elements=len(index))
+            if graph.get_current_count() == len(index):
+                return cls(graph, index, ef_search=ef_search, columns=columns, content_dir=content_dir)
+            graph = cls._new_graph(index.dim, len(index))
+
+        print(f"Building HNSW graph for {len(index)} vectors...")
+        if len(index):
+            graph.add_items(np.asarray(index.embeddings, dtype=np.float32), np.arange(len(index)))
+        os.makedirs(index_dir, exist_ok=True)
+        graph.save_index(graph_path)
+        return cls(graph, index, ef_search=ef_search, columns=columns, content_dir=content_dir)
+
+    def add(self, ids, vectors, documents=None, metadatas=None):
+        start = len(self.index)
+        numpy_store = NumpyVectorStore(self.index, columns=self.columns, content_dir=self.content_dir)
+        numpy_store.add(ids, vectors, metadatas=metadatas)
+        self.index = numpy_store.index
+        self.columns = numpy_store.columns
+        self.hnsw.resize_index(len(self.index))
+        self.hnsw.add_items(np.asarray(self.index.embeddings[start:], dtype=np.float32), np.arange(start, len(self.index)))
+        if self.content_dir is not None:
+            # Saved after the vectors, so the graph is not seen as stale on the next open
+            self.hnsw.save_index(os.path.join(NumpyVectorIndex.index_dir(self.content_dir), HNSW_FILENAME))
+
+    def query_batch(self, query_vectors, top_k=10, where=None):
+        if where:
+            # Filtered queries touch a small slice: exact search over those rows
+            rows = _filtered_rows(self.columns, where)
+            return self.index.search_batch(np.asarray(query_vectors, dtype=np.float32), top_k=top_k, rows=rows)
+
+        k = min(top_k, len(self.index))
+        if k == 0:
+            return [[] for _ in query_vectors]
+        queries = normalize_rows(np.asarray(query_vectors, dtype=np.float32).reshape(len(query_vectors), -1))
+        labels, distances = self.hnsw.knn_query(queries, k=k)
+        return [
+            [(self.index.ids[label], float(1.0 - distance)) for label, distance in zip(row_labels, row_distances)]
+            for row_labels, row_distances in zip(labels, distances)
+        ]
+
+    def embedding_index(self):
+        return self.index
+
+
+def _saved_numpy_index(content_dir, model_name, n_chunks):
+    """The saved NumpyVectorIndex if it matches the model, rag_chunks.json and chunk count, else None"""
+    version = content_version(content_dir, ("rag_chunks.json",))
+    index = NumpyVectorIndex.load(content_dir)
+    if (index is not None and index.meta.get("model") == model_name
+            and index.meta.get("content_version") == version and len(index) == n_chunks):
+        return index
+    return None
+
+
+def _chunk_vectors(model_name, chunks, collection=None):
+    """
+    (ids, vectors) of every chunk
+
+    Copied from a complete Chroma collection when one is given, so nothing
+    is re-encoded; otherwise the chunks are encoded.
+    """
+    ids = [str(chunk["id"]) for chunk in chunks]
+    if collection is not None and collection.count() >= len(ids):
+        print(f"Copying {len(ids)} chunk vectors from ChromaDB...")
+        stored = NumpyVectorIndex.from_collection(collection)
+        rows = [stored.row_by_id[doc_id] for doc_id in ids if doc_id in stored.row_by_id]
+        if len(rows) == len(ids):
+            return ids, np.asarray(stored.embeddings)[rows]
+
+    print(f"Encoding {len(ids)} chunks...")
+    vectors = get_text_encoder(model_name).encode(
+        [chunk["text"] for chunk in chunks],
+        batch_size=64,
+        show_progress_bar=True,
+        convert_to_numpy=True
+    )
+    return ids, vectors
+
+
+def _require_chunks(content_dir, chunks):
+    chunk_store = as_chunk_store(chunks) or ChunkStore.load(content_dir)
+    if chunk_store is None:
+        raise FileNotFoundError(f"Chunks file not found at {os.path.join(content_dir, 'rag_chunks.json')}")
+    return chunk_store
+
+
+def load_or_build_numpy_index(content_dir, model_name=DEFAULT_TEXT_MODEL, chunks=None, collection=None):
+    """
+    The saved NumpyVectorIndex of a manual, (re)built if missing or stale
+
+    The index is stale when the model, the content version of rag_chunks.json
+    or the chunk count changed. Rebuilds go through NumpyVectorStore.build.
+    """
+    chunk_store = _require_chunks(content_dir, chunks)
+    index = _saved_numpy_index(content_dir, model_name, len(chunk_store))
+    if index is not None:
+        return index
+    ids, vectors = _chunk_vectors(model_name, chunk_store, collection)
+    return NumpyVectorStore.build(content_dir, ids, vectors, model_name=model_name).index
+
+
+def open_vector_store(backend=None, content_dir=None, model_name=DEFAULT_TEXT_MODEL, chunks=None, collection=None):
+    """
+    Open the chunk vector store of a manual with the configured backend
+
+    The embedded backends reuse the saved vectors when they are current and
+    otherwise create the store with the backend's build().
+
+    Args:
+        backend: "chroma", "numpy" or "hnsw"; defaults to the VECTOR_BACKEND
+            environment variable, then "chroma"
+        content_dir: Directory with extracted content
+        model_name: SentenceTransformer the vectors come from
+        chunks: Chunk list or ChunkStore (loaded from content_dir if None)
+        collection: Already opened Chroma collection, if any
+
+    Returns:
+        VectorStore
+    """
+    backend = (backend or os.getenv("VECTOR_BACKEND", "chroma")).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown vector backend '{backend}'; expected one of {', '.join(BACKENDS)}")
+
+    if backend == "chroma":
+        if collection is None:
+            collection = open_chroma_collection(content_dir, model_name)
+        store = ChromaVectorStore(collection)
+        if not store.filterable:
+            chunk_store = as_chunk_store(chunks) or ChunkStore.load(content_dir)
+            if chunk_store is not None:
+                store.filterable = upgrade_chunk_metadata(collection, chunk_store)
+        return store
+
+    chunk_store = _require_chunks(content_dir, chunks)
+    store_cls = NumpyVectorStore if backend == "numpy" else HnswVectorStore
+    index = _saved_numpy_index(content_dir, model_name, len(chunk_store))
+    if index is None:
+        ids, vectors = _chunk_vectors(model_name, chunk_store, collection)
+        return store_cls.build(content_dir, ids, vectors,
+                               metadatas=[chunk_store.metadata_by_id[doc_id] for doc_id in ids],
+                               model_name=model_name)
+
+    columns = chunk_store.columns_for_ids(index.ids)
+    if backend == "numpy":
+        return NumpyVectorStore(index, columns=columns, content_dir=content_dir)
+    return HnswVectorStore.from_numpy_index(content_dir, index, columns=columns)
+
+
+def as_vector_store(store_or_collection):
+    """Wrap a Chroma collection in a ChromaVectorStore; stores are returned unchanged"""
+    if store_or_collection is None or isinstance(store_or_collection, VectorStore):
+        return store_or_collection
+    return ChromaVectorStore(store_or_collection)
+
+
+def benchmark(content_dir, backends=BACKENDS, n_queries=100, top_k=10, batch_size=16, model_name=DEFAULT_TEXT_MODEL):
+    """
+    Compare the backends on the same queries
+
+    Queries are section titles of randomly picked chunks. Reports the time to
+    open each store, single-query latency (p50/p95), batched latency per
+    query and recall@top_k against exact NumPy search.
+    """
+    from bench_utils import sample_title_queries
+    from query_encoder import encode_queries
+
+    chunks = ChunkStore.load(content_dir)
+    if chunks is None:
+        raise FileNotFoundError(f"Chunks file not found in {content_dir}")
+
+    queries = sample_title_queries(chunks, n_queries)
+    query_vectors = encode_queries(queries, model_name=model_name)
+
+    exact = NumpyVectorStore(load_or_build_numpy_index(content_dir, model_name, chunks=chunks))  # ground truth
+    truth = [set(doc_id for doc_id, _ in hits) for hits in exact.query_batch(query_vectors, top_k=top_k)]
+
+    print(f"{len(chunks)} chunks, {len(queries)} queries, top_k={top_k}, batch_size={batch_size}")
+    print(f"{'backend':<8} {'open s':>8} {'p50 ms':>8} {'p95 ms':>8} {'batch ms/q':>11} {'recall':>7}")
+    for backend in backends:
+        try:
+            start = time.perf_counter()
+            store = open_vector_store(backend, content_dir, model_name, chunks=chunks)
+            open_seconds = time.perf_counter() - start
+        except Exception as e:
+            print(f"{backend:<8} unavailable: {e}")
+            continue
+
+        store.query(query_vectors[0], top_k=top_k)  # warm-up
+        latencies, results = [], []
+        for vector in query_vectors:
+            start = time.perf_counter()
+            results.append(store.query(vector, top_k=top_k))
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        for i in range(0, len(query_vectors), batch_size):
+            store.query_batch(query_vectors[i:i + batch_size], top_k=top_k)
+        batch_ms = (time.perf_counter() - start) * 1000 / len(query_vectors)
+
+        recall = np.mean([len(truth[q] & set(doc_id for doc_id, _ in hits)) / max(len(truth[q]), 1)
+                          for q, hits in enumerate(results)])
+        print(f"{backend:<8} {open_seconds:>8.2f} {np.percentile(latencies, 50):>8.2f} "
+              f"{np.percentile(latencies, 95):>8.2f} {batch_ms:>11.3f} {recall:>7.3f}")
+
+
+def main():
+    """Build or benchmark the chunk vector stores of a content directory"""
+    parser = argparse.ArgumentParser(description="Chunk vector store backends")
+    parser.add_argument("--content_dir", "-d",
+                        default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                             "extracted_content_manual"),
+                        help="Directory containing the extracted content")
+    parser.add_argument("--model", "-m", default=DEFAULT_TEXT_MODEL, help="Sentence transformer model")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="Build (or refresh) the index of a backend")
+    build_parser.add_argument("--backend", "-b", choices=BACKENDS, default="numpy")
+
+    bench_parser = subparsers.add_parser("benchmark", help="Compare query latency and recall of the backends")
+    bench_parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    bench_parser.add_argument("--queries", type=int, default=100)
+    bench_parser.add_argument("--top_k", type=int, default=10)
+    bench_parser.add_argument("--batch_size", type=int, default=16)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        store = open_vector_store(args.backend, args.content_dir, args.model)
+        print(f"{store.name} vector store ready with {len(store)} vectors")
+    else:
+        benchmark(args.content_dir, backends=args.backends, n_queries=args.queries,
+                  top_k=args.top_k, batch_size=args.batch_size, model_name=args.model)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,19 @@
 import os
+import sys
 import json
-import numpy as np
-from sentence_transformers import SentenceTransformer
 import argparse
 from tqdm import tqdm
 import re
-import chromadb
-from chromadb.utils import embedding_functions
+
+# Shared modules (model registry, search engines) live next to the server in final/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "final"))
+from model_registry import get_text_encoder
+from chunk_store import ChunkStore, ChunkFilter
+from vector_store import open_chroma_collection, open_vector_store, upgrade_chunk_metadata
+from query_encoder import encode_query, encode_queries
 
 class DocumentRetrieval:
-    def __init__(self, content_dir=None, model_name="all-MiniLM-L6-v2", use_chroma=True):
+    def __init__(self, content_dir=None, model_name="all-MiniLM-L6-v2", use_chroma=True, backend=None):
         """
         Initialize the retrieval system with extracted content
         
@@ -17,39 +21,24 @@ class DocumentRetrieval:
             content_dir: Directory containing the extracted content
             model_name: Name of the embedding model to use
             use_chroma: Whether to use ChromaDB for vector storage
+            backend: Vector store used for search ("chroma", "numpy" or
+                "hnsw"); defaults to VECTOR_BACKEND, or "numpy" without ChromaDB
         """
         self.content_dir = self._find_content_dir(content_dir)
         self.chunks = []
+        self.chunk_store = None
         self.use_chroma = use_chroma
+        self.model_name = model_name
+        self.vector_store = None
+        self.backend = backend or (None if use_chroma else "numpy")
         
-        # Setup embeddings model
-        self.model = SentenceTransformer(model_name)
+        # Setup embeddings model (shared with the Chroma embedding function)
+        self.model = get_text_encoder(model_name)
         
         # Setup ChromaDB if enabled
         if use_chroma:
-            # Create persistent storage directory within content directory
-            chroma_dir = os.path.join(self.content_dir, "chroma_db")
-            if not os.path.exists(chroma_dir):
-                os.makedirs(chroma_dir)
-                
-            # Initialize persistent client
-            self.chroma_client = chromadb.PersistentClient(path=chroma_dir)
-            sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(model_name=model_name)
-            
-            # Create or get collection
-            collection_name = f"pdf_chunks_{os.path.basename(self.content_dir)}"
-            try:
-                self.collection = self.chroma_client.get_collection(
-                    name=collection_name, 
-                    embedding_function=sentence_transformer_ef
-                )
-                print(f"Using existing persistent ChromaDB collection: {collection_name}")
-            except:
-                self.collection = self.chroma_client.create_collection(
-                    name=collection_name,
-                    embedding_function=sentence_transformer_ef
-                )
-                print(f"Created new persistent ChromaDB collection: {collection_name}")
+            # Create or get the persistent collection
+            self.collection = open_chroma_collection(self.content_dir, model_name, create=True)
         
         # Load the chunks
         self.load_chunks()
@@ -104,6 +93,7 @@ class DocumentRetrieval:
             
         with open(chunks_path, "r", encoding="utf-8") as f:
             self.chunks = json.load(f)
+        self.chunk_store = ChunkStore(self.chunks)
             
         print(f"Loaded {len(self.chunks)} chunks from {chunks_path}")
         
@@ -124,14 +114,10 @@ class DocumentRetrieval:
                     if i < collection_count:
                         continue
                         
-                    chunk_id = str(chunk["id"])
-                    ids.append(chunk_id)
+                    ids.append(str(chunk["id"]))
                     texts.append(chunk["text"])
-                    
-                    # Store metadata (everything except the text field)
-                    metadata = {k: str(v) if not isinstance(v, (int, float, bool, str)) else v 
-                               for k, v in chunk.items() if k != "text"}
-                    metadatas.append(metadata)
+                    # Typed metadata (int pages) so searches can filter on it
+                    metadatas.append(self.chunk_store.metadata[i])
                 
                 # Add to collection in batches to prevent memory issues
                 batch_size = 100
@@ -144,57 +130,65 @@ class DocumentRetrieval:
                     )
                     
                 print(f"Added chunks to ChromaDB collection")
+
+            # Collections ingested before page filters existed get typed metadata
+            upgrade_chunk_metadata(self.collection, self.chunk_store)
+
+        # Vector store used for search (the collection itself, or an index built from it)
+        self.vector_store = open_vector_store(
+            self.backend, self.content_dir, self.model_name,
+            chunks=self.chunk_store, collection=self.collection if self.use_chroma else None
+        )
+        print(f"Searching with the {self.vector_store.name} vector store")
     
-    def search(self, query, top_k=3):
+    def _format_hits(self, hits):
+        """Turn (id, score) pairs into chunk copies with a score field"""
+        results = []
+        for doc_id, score in hits:
+            chunk = self.chunk_store.get(doc_id)
+            if chunk is not None:
+                result = chunk.copy()
+                result["score"] = score
+                results.append(result)
+        return results
+
+    def search_batch(self, queries, top_k=3, pages=None, section_ids=None):
+        """
+        Search several queries at once
+
+        One encoder call (for the queries not in the query cache) and one
+        batched vector store query for all queries.
+
+        Args:
+            queries: The search queries
+            top_k: Number of results to return per query
+            pages: Only return chunks overlapping these pages
+            section_ids: Only return chunks from these sections
+
+        Returns:
+            One list of relevant chunks per query
+        """
+        query_embeddings = encode_queries(queries, model_name=self.model_name)
+        where = ChunkFilter(pages=pages, section_ids=section_ids)
+        hits = self.vector_store.query_batch(query_embeddings, top_k=top_k, where=where or None)
+        return [self._format_hits(query_hits) for query_hits in hits]
+
+    def search(self, query, top_k=3, pages=None, section_ids=None):
         """
         Search for relevant chunks based on the query
         
         Args:
             query: The search query
             top_k: Number of results to return
+            pages: Only return chunks overlapping these pages
+            section_ids: Only return chunks from these sections
             
         Returns:
-            List of relevant chunks
+            List of relevant chunks, each with its cosine similarity as "score"
         """
-        if self.use_chroma:
-            # Use ChromaDB for search
-            results = self.collection.query(
-                query_texts=[query],
-                n_results=top_k
-            )
-            
-            # Format results to match the original format
-            formatted_results = []
-            for i, doc_id in enumerate(results["ids"][0]):
-                # Find original chunk
-                for chunk in self.chunks:
-                    if str(chunk["id"]) == doc_id:
-                        result = chunk.copy()
-                        result["score"] = float(results["distances"][0][i]) if "distances" in results else 0.0
-                        formatted_results.append(result)
-                        break
-            
-            return formatted_results
-        else:
-            # Use original in-memory search approach
-            # Generate embedding for the query
-            query_embedding = self.model.encode([query])[0]
-            
-            # Calculate cosine similarity
-            scores = np.dot(self.embeddings, query_embedding) / (
-                np.linalg.norm(self.embeddings, axis=1) * np.linalg.norm(query_embedding)
-            )
-            
-            # Get top_k results
-            top_indices = np.argsort(scores)[::-1][:top_k]
-            results = []
-            
-            for idx in top_indices:
-                result = self.chunks[idx].copy()
-                result["score"] = float(scores[idx])
-                results.append(result)
-                
-            return results
+        query_embedding = encode_query(query, model_name=self.model_name)
+        where = ChunkFilter(pages=pages, section_ids=section_ids)
+        return self._format_hits(self.vector_store.query(query_embedding, top_k=top_k, where=where or None))
     
     def display_results(self, results):
         """Format and display search results"""
@@ -243,13 +237,18 @@ def main():
     parser.add_argument("--query", "-q", help="Search query")
     parser.add_argument("--top_k", "-k", type=int, default=3, help="Number of results to return")
     parser.add_argument("--no-chroma", action="store_true", help="Don't use ChromaDB")
+    parser.add_argument("--backend", "-b", choices=["chroma", "numpy", "hnsw"],
+                        help="Vector store used for search (default: VECTOR_BACKEND or chroma)")
+    parser.add_argument("--page", "-p", type=int, action="append",
+                        help="Only search chunks on this page (can be repeated)")
     args = parser.parse_args()
     
     # Initialize the retrieval system
     try:
         retrieval = DocumentRetrieval(
             content_dir=args.content_dir, 
-            use_chroma=not args.no_chroma
+            use_chroma=not args.no_chroma,
+            backend=args.backend
         )
         
         # Interactive mode if no query provided
@@ -263,11 +262,11 @@ def main():
                 if not query.strip():
                     continue
                     
-                results = retrieval.search(query, top_k=args.top_k)
+                results = retrieval.search(query, top_k=args.top_k, pages=args.page)
                 retrieval.display_results(results)
         else:
             # Single query mode
-            results = retrieval.search(args.query, top_k=args.top_k)
+            results = retrieval.search(args.query, top_k=args.top_k, pages=args.page)
             retrieval.display_results(results)
     
     except Exception as e: